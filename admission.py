@@ -0,0 +1,297 @@
+"""
+Admission control and load shedding for expensive endpoints.
+
+Each limited endpoint has its own gate with a fixed number of concurrent
+slots and a small, bounded wait queue. Requests are classified into lanes:
+interactive form submissions wait ahead of API/batch traffic, and when the
+queue is full an interactive request displaces the newest batch waiter.
+A request is rejected up front with 503 when its estimated wait (queue
+position times the endpoint's recent service time) would exceed its
+deadline, rather than after it has already waited. Every client is also
+rate limited by a token bucket keyed on user id, which answers 429.
+Anonymous clients are keyed on their address only when
+ADMISSION_LIMIT_ANONYMOUS is set: behind a reverse proxy without
+PROXY_FIX_HOPS every anonymous user would share the proxy's address and
+one bucket. Otherwise they are covered by the gates alone.
+
+Rejections are cheap: no form parsing, model scoring or database work
+happens before admission, and the response carries Retry-After.
+"""
+import functools
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, render_template, jsonify
+from flask_login import current_user
+
+from hashing import TokenBucket
+
+INTERACTIVE = 0
+BATCH = 1
+LANES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+# Weight of the newest request in the per-endpoint service time average
+SERVICE_TIME_ALPHA = 0.2
+
+_config = {
+    'enabled': True,
+    'concurrency': 4,
+    'queue_size': 16,
+    'max_wait': {INTERACTIVE: 2.0, BATCH: 0.5},
+    'user_rate': 1.0,
+    'user_burst': 10,
+    'limit_anonymous': False,
+    'max_clients': 10000
+}
+_gates = {}
+_buckets = OrderedDict()
+_lock = threading.Lock()
+_rate_limited = {name: 0 for name in LANES.values()}
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; status is 429 or 503, retry_after in seconds."""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def init_app(app):
+    """Read admission limits from the Flask app config."""
+    _config['enabled'] = app.config.get('ADMISSION_ENABLED', True)
+    _config['concurrency'] = app.config.get('ADMISSION_CONCURRENCY', 4)
+    _config['queue_size'] = app.config.get('ADMISSION_QUEUE_SIZE', 16)
+    _config['max_wait'] = {
+        INTERACTIVE: app.config.get('ADMISSION_MAX_WAIT', 2.0),
+        BATCH: app.config.get('ADMISSION_BATCH_MAX_WAIT', 0.5)
+    }
+    _config['user_rate'] = app.config.get('ADMISSION_USER_RATE', 1.0)
+    _config['user_burst'] = app.config.get('ADMISSION_USER_BURST', 10)
+    _config['limit_anonymous'] = app.config.get('ADMISSION_LIMIT_ANONYMOUS', False)
+
+def _lane():
+    """Batch lane for JSON/API calls or an explicit X-Priority: batch header, interactive otherwise."""
+    if request.is_json or request.path.startswith('/api/'):
+        return BATCH
+    if request.headers.get('X-Priority', '').lower() == 'batch':
+        return BATCH
+    return INTERACTIVE
+
+def _client_key():
+    """Rate limit key for this request, or None when it is not rate limited."""
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    if _config['limit_anonymous']:
+        # The real client address when ProxyFix is configured
+        return f"addr:{request.remote_addr}"
+    return None
+
+def _take_token(lane):
+    """Take a token from the client's bucket and return the bucket, or None if not limited."""
+    key = _client_key()
+    if key is None:
+        return None
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(_config['user_rate'], _config['user_burst'])
+            # Forget the least recently seen clients; a fresh bucket starts full anyway
+            while len(_buckets) > _config['max_clients']:
+                _buckets.popitem(last=False)
+        else:
+            _buckets.move_to_end(key)
+    wait = bucket.take()
+    if wait:
+        with _lock:
+            _rate_limited[LANES[lane]] += 1
+        raise Overloaded("Rate limit exceeded", 429, wait)
+    return bucket
+
+def _gate(endpoint):
+    with _lock:
+        gate = _gates.get(endpoint)
+        if gate is None:
+            gate = _gates[endpoint] = _Gate(endpoint, _config['concurrency'], _config['queue_size'])
+        return gate
+
+def _reject(e):
+    logging.warning(f"Shed {request.method} {request.path}: {e.reason}")
+    headers = {'Retry-After': str(e.retry_after)}
+    if request.is_json or request.path.startswith('/api/'):
+        return jsonify({'error': e.reason, 'retry_after': e.retry_after}), e.status, headers
+    return render_template('busy.html', reason=e.reason, retry_after=e.retry_after), e.status, headers
+
+def limit(methods=('POST',)):
+    """
+    Put a view behind its endpoint's admission gate and the per-client rate limit.
+
+    Args:
+        methods (tuple): HTTP methods that are limited; others pass straight through
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in methods or not _config['enabled']:
+                return view(*args, **kwargs)
+
+            lane = _lane()
+            gate = _gate(request.endpoint)
+            try:
+                bucket = _take_token(lane)
+            except Overloaded as e:
+                return _reject(e)
+            try:
+                gate.acquire(lane, _config['max_wait'][lane])
+            except Overloaded as e:
+                # Shed by the gate: the client did no work, so the token goes back
+                if bucket is not None:
+                    bucket.refund()
+                return _reject(e)
+
+            started = time.perf_counter()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                gate.release(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def stats():
+    """Per-endpoint admission counters, including requests shed by reason and lane."""
+    with _lock:
+        gates = list(_gates.values())
+        rate_limited = dict(_rate_limited)
+        clients = len(_buckets)
+    return {
+        'enabled': _config['enabled'],
+        'tracked_clients': clients,
+        'rate_limited': rate_limited,
+        'endpoints': {gate.name: gate.stats() for gate in gates}
+    }
+
+
+class _Waiter:
+    __slots__ = ('lane', 'state')
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.state = 'waiting'
+
+
+class _Gate:
+    """Concurrency limit with a bounded priority queue of waiting requests."""
+
+    def __init__(self, name, limit, queue_size):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.service_time = 0.05
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._counts = {
+            'admitted': 0,
+            'queued': 0,
+            'shed_queue_full': 0,
+            'shed_deadline': 0,
+            'shed_displaced': 0,
+            'max_queue_depth': 0,
+            'wait_seconds': 0.0
+        }
+        self._lanes = {name: {'admitted': 0, 'shed': 0} for name in LANES.values()}
+
+    def acquire(self, lane, max_wait):
+        """
+        Take a slot, waiting in the queue for at most max_wait seconds.
+
+        Raises:
+            Overloaded: The queue is full, or the slot would not come in time
+        """
+        with self._cond:
+            if self.active < self.limit and not self._queue:
+                self.active += 1
+                self._admitted(lane, 0.0)
+                return
+
+            # Requests in this lane or a higher-priority one are served first
+            ahead = sum(1 for entry in self._queue if entry[0] <= lane)
+            estimate = (ahead + 1) / self.limit * self.service_time
+            if estimate > max_wait:
+                self._shed(lane, 'shed_deadline')
+                raise Overloaded("Estimated wait exceeds deadline", 503, estimate)
+
+            if len(self._queue) >= self.queue_size:
+                worst = max(self._queue) if self._queue else None
+                if worst is None or worst[0] <= lane:
+                    self._shed(lane, 'shed_queue_full')
+                    raise Overloaded("Request queue is full", 503, estimate)
+                # Make room by dropping the newest waiter of a lower-priority lane
+                self._queue.remove(worst)
+                heapq.heapify(self._queue)
+                worst[2].state = 'displaced'
+                self._shed(worst[0], 'shed_displaced')
+                self._cond.notify_all()
+
+            waiter = _Waiter(lane)
+            entry = (lane, next(self._sequence), waiter)
+            heapq.heappush(self._queue, entry)
+            self._counts['queued'] += 1
+            self._counts['max_queue_depth'] = max(self._counts['max_queue_depth'], len(self._queue))
+
+            started = time.monotonic()
+            deadline = started + max_wait
+            while waiter.state == 'waiting':
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._shed(lane, 'shed_deadline')
+                    raise Overloaded("Timed out waiting for capacity", 503, self.service_time)
+                self._cond.wait(remaining)
+
+            if waiter.state == 'displaced':
+                raise Overloaded("Displaced by higher-priority requests", 503, max_wait)
+            self._admitted(lane, time.monotonic() - started)
+
+    def release(self, service_seconds):
+        """Free a slot, handing it directly to the highest-priority waiter if there is one."""
+        with self._cond:
+            self.service_time += SERVICE_TIME_ALPHA * (service_seconds - self.service_time)
+            if self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                # The slot passes to the waiter, so active stays the same
+                waiter.state = 'admitted'
+                self._cond.notify_all()
+            else:
+                self.active -= 1
+
+    def stats(self):
+        with self._cond:
+            counts = dict(self._counts)
+            admitted = counts['admitted']
+            counts['avg_wait_ms'] = round(counts.pop('wait_seconds') * 1000 / admitted, 2) if admitted else 0.0
+            counts.update({
+                'limit': self.limit,
+                'active': self.active,
+                'queue_depth': len(self._queue),
+                'service_ms': round(self.service_time * 1000, 2),
+                'lanes': {name: dict(lane) for name, lane in self._lanes.items()}
+            })
+            return counts
+
+    def _admitted(self, lane, waited):
+        self._counts['admitted'] += 1
+        self._counts['wait_seconds'] += waited
+        self._lanes[LANES[lane]]['admitted'] += 1
+
+    def _shed(self, lane, reason):
+        self._counts[reason] += 1
+        self._lanes[LANES[lane]]['shed'] += 1
@@ -7,14 +7,23 @@ from flask import Flask
 from flask_pymongo import PyMongo
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
+import storage
+import http_cache
+import drift
+import xray
+import admission
+import profiler
+from hashing import PasswordHasher
+
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; DEBUG logs every request and query and costs throughput
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 class Base(DeclarativeBase):
     pass
@@ -23,12 +32,20 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 mongo = PyMongo()
 bcrypt = Bcrypt()
+password_hasher = PasswordHasher(bcrypt)
 login_manager = LoginManager()
 
 # Create the app
-app = Flask(__name__)
+# INSTANCE_PATH moves the database, drift sketches, archives and X-ray store elsewhere
+app = Flask(__name__, instance_path=os.environ.get("INSTANCE_PATH"))
 app.secret_key = os.environ.get("SECRET_KEY", "dev_secret_key")
 
+# Number of reverse proxies in front of the app whose X-Forwarded-* headers are trusted
+app.config["PROXY_FIX_HOPS"] = int(os.environ.get("PROXY_FIX_HOPS", "0"))
+if app.config["PROXY_FIX_HOPS"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_HOPS"],
+                            x_proto=app.config["PROXY_FIX_HOPS"], x_host=app.config["PROXY_FIX_HOPS"])
+
 # Register template test
 @app.template_test('search')
 def search_test(value, pattern):
@@ -39,14 +56,85 @@ def search_test(value, pattern):
     return False
 
 # Configure SqlAlchemy
-db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'disease_prediction.db')
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# DATABASE_URL selects a server database; otherwise the SQLite file in instance/ is used
+db_path = os.path.join(app.instance_path, 'disease_prediction.db')
+app.config["SQLALCHEMY_DATABASE_URI"] = storage.database_uri(db_path)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = storage.engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Configure ML inference backend ('inline' or 'process')
+app.config["INFERENCE_BACKEND"] = os.environ.get("INFERENCE_BACKEND", "inline")
+# Processes per web process: every gunicorn worker starts its own pool
+app.config["INFERENCE_PROCESSES"] = int(os.environ.get("INFERENCE_PROCESSES", os.cpu_count() or 1))
+app.config["INFERENCE_TIMEOUT"] = float(os.environ.get("INFERENCE_TIMEOUT", "5"))
+
+# Configure the Flask-Login user cache
+app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", "1024"))
+app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", "60"))
+
+# Configure password hashing: bcrypt cost and the dedicated hashing executor
+app.config["BCRYPT_LOG_ROUNDS"] = int(os.environ.get("BCRYPT_LOG_ROUNDS", "12"))
+app.config["HASHING_WORKERS"] = int(os.environ.get("HASHING_WORKERS", "2"))
+app.config["HASHING_QUEUE_SIZE"] = int(os.environ.get("HASHING_QUEUE_SIZE", "16"))
+app.config["HASHING_RATE"] = float(os.environ.get("HASHING_RATE", "20"))
+app.config["HASHING_BURST"] = int(os.environ.get("HASHING_BURST", "40"))
+app.config["HASHING_TIMEOUT"] = float(os.environ.get("HASHING_TIMEOUT", "10"))
+
+# Cache rendered anonymous pages for static routes
+app.config["PAGE_CACHE_ENABLED"] = os.environ.get("PAGE_CACHE_ENABLED", "true").lower() == "true"
+
+# Seconds between writes of each worker's drift sketches to instance/drift
+app.config["DRIFT_FLUSH_INTERVAL"] = int(os.environ.get("DRIFT_FLUSH_INTERVAL", "60"))
+# Hours of recent inputs compared against the model reference
+app.config["DRIFT_WINDOW_HOURS"] = int(os.environ.get("DRIFT_WINDOW_HOURS", "24"))
+
+# Configure prediction retention: months kept live before archiving to instance/archive
+app.config["RETENTION_ENABLED"] = os.environ.get("RETENTION_ENABLED", "true").lower() == "true"
+app.config["RETENTION_MONTHS"] = int(os.environ.get("RETENTION_MONTHS", "12"))
+app.config["RETENTION_BATCH_SIZE"] = int(os.environ.get("RETENTION_BATCH_SIZE", "500"))
+app.config["RETENTION_INTERVAL"] = int(os.environ.get("RETENTION_INTERVAL", "3600"))
+app.config["MONGO_TTL_DAYS"] = int(os.environ["MONGO_TTL_DAYS"]) if os.environ.get("MONGO_TTL_DAYS") else None
+
+# Configure the chest X-ray pipeline (requires Pillow)
+app.config["XRAY_IMAGE_SIZE"] = int(os.environ.get("XRAY_IMAGE_SIZE", "128"))
+app.config["XRAY_BATCH_SIZE"] = int(os.environ.get("XRAY_BATCH_SIZE", "16"))
+app.config["XRAY_BATCH_WAIT_MS"] = float(os.environ.get("XRAY_BATCH_WAIT_MS", "5"))
+app.config["XRAY_DECODE_WORKERS"] = int(os.environ.get("XRAY_DECODE_WORKERS", "2"))
+app.config["XRAY_MAX_BYTES"] = int(os.environ.get("XRAY_MAX_BYTES", str(10 * 1024 * 1024)))
+# Largest request body accepted: one X-ray upload plus room for the form fields
+app.config["MAX_CONTENT_LENGTH"] = app.config["XRAY_MAX_BYTES"] + 1024 * 1024
+app.config["XRAY_MAX_PIXELS"] = int(os.environ.get("XRAY_MAX_PIXELS", "25000000"))
+# Disk cap of the preprocessed tensor store in instance/xray
+app.config["XRAY_CACHE_MAX_MB"] = int(os.environ.get("XRAY_CACHE_MAX_MB", "256"))
+
+# Configure admission control for the prediction endpoints
+app.config["ADMISSION_ENABLED"] = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+app.config["ADMISSION_CONCURRENCY"] = int(os.environ.get("ADMISSION_CONCURRENCY", "4"))
+app.config["ADMISSION_QUEUE_SIZE"] = int(os.environ.get("ADMISSION_QUEUE_SIZE", "16"))
+app.config["ADMISSION_MAX_WAIT"] = float(os.environ.get("ADMISSION_MAX_WAIT", "2"))
+app.config["ADMISSION_BATCH_MAX_WAIT"] = float(os.environ.get("ADMISSION_BATCH_MAX_WAIT", "0.5"))
+app.config["ADMISSION_USER_RATE"] = float(os.environ.get("ADMISSION_USER_RATE", "1"))
+app.config["ADMISSION_USER_BURST"] = int(os.environ.get("ADMISSION_USER_BURST", "10"))
+# Anonymous clients are limited by address, which is only the real client once
+# PROXY_FIX_HOPS is set (or when the app is exposed directly)
+app.config["ADMISSION_LIMIT_ANONYMOUS"] = os.environ.get(
+    "ADMISSION_LIMIT_ANONYMOUS", "true" if app.config["PROXY_FIX_HOPS"] else "false").lower() == "true"
+
+# Configure the sampling profiler; slow-request capture is off unless PROFILER_SLOW_MS is set
+app.config["PROFILER_INTERVAL_MS"] = float(os.environ.get("PROFILER_INTERVAL_MS", "10"))
+app.config["PROFILER_SLOW_MS"] = float(os.environ.get("PROFILER_SLOW_MS", "0"))
+app.config["PROFILER_SLOW_KEEP"] = int(os.environ.get("PROFILER_SLOW_KEEP", "50"))
+
+# Configure candidate models evaluated against the primaries ('shadow', 'canary' or 'off')
+app.config["CANDIDATE_HEART_MODEL"] = os.environ.get("CANDIDATE_HEART_MODEL")
+app.config["CANDIDATE_DIABETES_MODEL"] = os.environ.get("CANDIDATE_DIABETES_MODEL")
+app.config["CANDIDATE_MODE"] = os.environ.get("CANDIDATE_MODE", "shadow")
+app.config["CANDIDATE_SHADOW_RATE"] = float(os.environ.get("CANDIDATE_SHADOW_RATE", "0.1"))
+app.config["CANDIDATE_CANARY_PERCENT"] = float(os.environ.get("CANDIDATE_CANARY_PERCENT", "5"))
+app.config["CANDIDATE_MAX_ERROR_RATE"] = float(os.environ.get("CANDIDATE_MAX_ERROR_RATE", "0.02"))
+app.config["CANDIDATE_MAX_LATENCY_RATIO"] = float(os.environ.get("CANDIDATE_MAX_LATENCY_RATIO", "1.5"))
+app.config["CANDIDATE_MIN_SAMPLES"] = int(os.environ.get("CANDIDATE_MIN_SAMPLES", "50"))
+
 # Configure MongoDB
 app.config["MONGO_URI"] = os.environ.get("MONGODB_URI", "mongodb://localhost:27017/disease_prediction")
 
@@ -58,14 +146,31 @@ login_manager.login_message_category = 'info'
 db.init_app(app)
 mongo.init_app(app)
 bcrypt.init_app(app)
+password_hasher.init_app(app)
 login_manager.init_app(app)
 
+# Precompressed static assets with content-versioned URLs
+http_cache.precompress_static(app)
+drift.init_app(app)
+xray.init_app(app)
+admission.init_app(app)
+profiler.init_app(app)
+
 # Create database tables
 with app.app_context():
+    # WAL, busy timeout and per-connection pragmas for SQLite
+    storage.apply_sqlite_profile(db.engine)
+
     # Import models
     import models  # noqa: F401
     db.create_all()
 
+    # create_all skips existing tables, so add any columns and indexes declared since they were created
+    storage.add_missing_columns(db.engine, db.metadata)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
     # Create admin user if not exists
     from models import User
     try:
@@ -91,3 +196,7 @@ from routes import *
 with app.app_context():
     from routes import initialize
     initialize()
+
+# Start the background prediction archival job
+import retention
+retention.init_app(app)
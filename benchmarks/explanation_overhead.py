@@ -0,0 +1,50 @@
+"""
+Cost of per-feature explanations relative to plain scoring.
+
+Times score_probabilities against feature_contributions for each model at
+several batch sizes and reports the explanation overhead as a fraction of
+inference time.
+
+Usage: python benchmarks/explanation_overhead.py [repeats]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import ml_models
+
+SAMPLES = {
+    'heart': np.array([63, 1, 3, 145, 233, 1, 0, 150, 0, 2.3, 0, 0, 1], dtype=float),
+    'diabetes': np.array([6, 148, 72, 35, 0, 33.6, 0.627, 50], dtype=float),
+}
+
+
+def best_of(fn, X, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    ml_models.initialize_models()
+    rng = np.random.default_rng(42)
+
+    print(f"{'model':>9} {'batch':>6} {'score ms':>10} {'explain ms':>11} {'overhead':>9}")
+    for disease, sample in SAMPLES.items():
+        for batch in (1, 100, 1000):
+            X = sample + rng.normal(0, 0.1, (batch, sample.size)) * sample
+            score = best_of(lambda X: ml_models.score_probabilities(disease, X), X, repeats)
+            explain = best_of(lambda X: ml_models.feature_contributions(disease, X), X, repeats)
+            print(f"{disease:>9} {batch:>6} {score * 1000:>10.3f} {explain * 1000:>11.3f} {explain / score:>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
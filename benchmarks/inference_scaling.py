@@ -0,0 +1,60 @@
+"""
+Multicore scaling benchmark for the inference backends.
+
+Runs N client threads issuing single-row heart predictions against the inline
+backend and the process pool, and reports throughput for each thread count.
+
+Usage: python benchmarks/inference_scaling.py [seconds_per_step]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import ml_models
+import inference_pool
+
+SAMPLE = np.array([[63, 1, 3, 145, 233, 1, 0, 150, 0, 2.3, 0, 0, 1]], dtype=float)
+
+
+def run(score, threads, seconds):
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def client(slot):
+        while time.perf_counter() < deadline:
+            score('heart', SAMPLE)
+            counts[slot] += 1
+
+    workers = [threading.Thread(target=client, args=(slot,)) for slot in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    cores = os.cpu_count() or 1
+    thread_counts = sorted({1, 2, 4, cores, cores * 2})
+
+    ml_models.initialize_models()
+    pool = inference_pool.ProcessInferencePool(processes=cores)
+    pool.start()
+    try:
+        print(f"{'threads':>8} {'inline req/s':>14} {'process req/s':>14} {'speedup':>8}")
+        for threads in thread_counts:
+            inline = run(ml_models.score_probabilities, threads, seconds)
+            process = run(pool.predict_proba, threads, seconds)
+            print(f"{threads:>8} {inline:>14.1f} {process:>14.1f} {process / inline:>7.2f}x")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
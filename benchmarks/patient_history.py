@@ -0,0 +1,162 @@
+"""
+Latency of patient history queries on the typed observation table.
+
+Runs against a throwaway SQLite database filled with synthetic assessments:
+P patients with N observations between them, spread over two years. A
+third of the visits are combined screenings (three observations at the
+same time, sharing age); the rest are single heart, diabetes or pneumonia
+assessments. Then times, over random patients:
+- latest: the last 10 glucose values for a patient
+- deltas: glucose changes over 365 days
+- risk_trajectory: heart probability and its slope
+- cohort: patients whose latest glucose in 90 days is at least 140, and
+  whose latest age in 90 days is 65 or over (a feature shared by two types)
+
+For comparison it also times the same per-patient trend read the way it
+would have to be done without the observation table: loading the patient's
+Prediction rows and decoding input_data JSON.
+
+Defaults to 1M observations over 20k patients; loading takes a few minutes.
+
+Usage: python benchmarks/patient_history.py [observations] [patients]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}"
+os.environ['RETENTION_ENABLED'] = 'false'
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+import logging
+logging.disable(logging.WARNING)
+
+import numpy as np
+
+from app import app, db
+import patient_history
+from models import User, Patient, PatientObservation, Prediction
+
+CHUNK = 20000
+QUERIES = 200
+
+
+def synthetic_features(prediction_type, rng):
+    if prediction_type == 'heart':
+        return {'age': rng.randint(30, 80), 'sex': rng.randint(0, 1), 'cp': rng.randint(0, 3),
+                'trestbps': rng.randint(100, 180), 'chol': rng.randint(150, 320), 'fbs': rng.randint(0, 1),
+                'restecg': rng.randint(0, 2), 'thalach': rng.randint(100, 190), 'exang': rng.randint(0, 1),
+                'oldpeak': round(rng.uniform(0, 4), 1), 'slope': rng.randint(0, 2), 'ca': rng.randint(0, 3),
+                'thal': rng.randint(1, 3)}
+    if prediction_type == 'diabetes':
+        return {'age': rng.randint(21, 80), 'pregnancies': rng.randint(0, 8), 'glucose': rng.randint(70, 200),
+                'blood_pressure': rng.randint(60, 100), 'skin_thickness': rng.randint(10, 40),
+                'insulin': rng.randint(0, 250), 'bmi': round(rng.uniform(18, 42), 1),
+                'diabetes_pedigree': round(rng.uniform(0.1, 1.5), 3)}
+    return {'temperature': round(rng.uniform(97, 103), 1), 'cough_severity': rng.randint(0, 10),
+            'breathing_difficulty': rng.randint(0, 10), 'oxygen_level': rng.randint(85, 100)}
+
+def populate(observations, patients):
+    """Bulk-insert patients, their predictions and matching observations."""
+    rng = random.Random(7)
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+
+    db.session.bulk_insert_mappings(Patient, [
+        {'id': i + 1, 'user_id': user.id, 'name': f'Patient {i + 1}', 'reference': f'MRN{i + 1:07d}'}
+        for i in range(patients)
+    ])
+    db.session.commit()
+
+    now = datetime.utcnow()
+    next_id = 1
+    while next_id <= observations:
+        predictions, rows = [], []
+        end = min(next_id + CHUNK, observations + 1)
+        while next_id < end:
+            patient_id = rng.randint(1, patients)
+            observed_at = now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+            if rng.random() < 1 / 3 and end - next_id >= 3:
+                types = ('heart', 'diabetes', 'pneumonia')
+            else:
+                types = (rng.choice(('heart', 'diabetes', 'pneumonia')),)
+            age = rng.randint(30, 80)
+            for prediction_type in types:
+                features = synthetic_features(prediction_type, rng)
+                if 'age' in features:
+                    features['age'] = age
+                probability = rng.random()
+                predictions.append({
+                    'id': next_id, 'user_id': user.id, 'patient_id': patient_id,
+                    'prediction_type': prediction_type, 'result': 'Positive' if probability > 0.5 else 'Negative',
+                    'confidence': probability, 'input_data': json.dumps(features), 'created_at': observed_at
+                })
+                rows.append(dict(features, patient_id=patient_id, prediction_id=next_id,
+                                 prediction_type=prediction_type, observed_at=observed_at,
+                                 probability=probability, positive=probability > 0.5))
+                next_id += 1
+        db.session.bulk_insert_mappings(Prediction, predictions)
+        db.session.bulk_insert_mappings(PatientObservation, rows)
+        db.session.commit()
+
+def json_deltas(patient_id, feature, days):
+    """The trend read without the observation table: decode every prediction's input_data."""
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = Prediction.query.filter(
+        Prediction.patient_id == patient_id,
+        Prediction.created_at >= since
+    ).order_by(Prediction.created_at).all()
+    values = []
+    for row in rows:
+        value = json.loads(row.input_data).get(feature)
+        if value is not None:
+            values.append((row.created_at, value))
+    return [b - a for (_, a), (_, b) in zip(values, values[1:])]
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - started)
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)) * 1000, 3),
+        'p95_ms': round(float(np.percentile(samples, 95)) * 1000, 3)
+    }
+
+def main():
+    observations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    patients = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rng = random.Random(11)
+
+    with app.app_context():
+        started = time.perf_counter()
+        populate(observations, patients)
+        # No ANALYZE: the app never runs it, so plans here match a live database
+        load_seconds = time.perf_counter() - started
+
+        sample = [rng.randint(1, patients) for _ in range(QUERIES)]
+        report = {
+            'observations': observations,
+            'patients': patients,
+            'load_seconds': round(load_seconds, 1),
+            'latest': timed(patient_history.latest, [(p, 'glucose') for p in sample]),
+            'deltas': timed(patient_history.deltas, [(p, 'glucose', 365) for p in sample]),
+            'risk_trajectory': timed(patient_history.risk_trajectory, [(p, 'heart') for p in sample]),
+            'json_decode_deltas': timed(json_deltas, [(p, 'glucose', 365) for p in sample]),
+            'cohort': timed(lambda: patient_history.cohort('glucose', days=90, min_value=140), [()] * 20),
+            'cohort_shared_feature': timed(lambda: patient_history.cohort('age', days=90, min_value=65), [()] * 20)
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Request overhead of the sampling profiler.
+
+Serves the heart disease form page through the Flask test client with the
+profiler fully off, with slow-request capture only, and with a profiling
+session sampling every request, and reports requests per second for each.
+
+Usage: python benchmarks/profiler_overhead.py [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# A throwaway instance folder, so the run leaves nothing in the real database or instance/
+WORKDIR = tempfile.mkdtemp()
+os.environ['INSTANCE_PATH'] = WORKDIR
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}"
+os.environ['RETENTION_ENABLED'] = 'false'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from app import app
+import profiler
+
+
+def throughput(client, requests):
+    client.get('/heart-disease')
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get('/heart-disease')
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    client = app.test_client()
+    # Well above any request here, so capture bookkeeping runs but nothing is kept
+    threshold = 10.0
+
+    modes = [
+        ('off', 0, False),
+        ('slow capture', threshold, False),
+        ('session, rate 1.0', threshold, True),
+    ]
+    baseline = None
+    for name, slow_threshold, session in modes:
+        profiler._config['slow_threshold'] = slow_threshold
+        if session:
+            profiler.start(seconds=600, rate=1.0)
+        rate = throughput(client, requests)
+        profiler.stop()
+        baseline = baseline or rate
+        print(f"{name:>18}: {rate:8.1f} req/s ({rate / baseline - 1:+.1%})")
+    print(f"Session samples collected: {profiler.status()['session']['samples']}")
+
+
+if __name__ == '__main__':
+    main()
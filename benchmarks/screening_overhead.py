@@ -0,0 +1,139 @@
+"""
+End-to-end cost of a combined screening versus three separate assessments.
+
+Runs against a throwaway SQLite database. For each of N visits it times:
+- sequential: validate, score and save heart, diabetes and pneumonia one
+  after another, committing each row separately (three form submissions)
+- combined: validate_screening_form, predict_screening and save_predictions
+  with one commit and one MongoDB insert_many
+
+Scoring alone is also timed to show what running the heart forest
+concurrently saves. MongoDB writes are included when MONGODB_URI is
+reachable; otherwise only SQLite is timed, and the report counts the
+MongoDB round trips each path would make.
+
+Usage: python benchmarks/screening_overhead.py [visits]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}"
+os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/disease_prediction_bench?serverSelectionTimeoutMS=500')
+os.environ['RETENTION_ENABLED'] = 'false'
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+import logging
+logging.disable(logging.WARNING)
+
+import numpy as np
+
+from app import app, db, mongo
+import ml_models
+import utils
+from models import Prediction
+
+FORM = {
+    # Heart; age is shared with diabetes
+    'age': '54', 'sex': '1', 'cp': '2', 'trestbps': '130', 'chol': '246', 'fbs': '0', 'restecg': '1',
+    'thalach': '150', 'exang': '0', 'oldpeak': '1.0', 'slope': '1', 'ca': '0', 'thal': '2',
+    # Diabetes
+    'pregnancies': '2', 'glucose': '120', 'blood_pressure': '72', 'skin_thickness': '25',
+    'insulin': '80', 'bmi': '28.4', 'diabetes_pedigree': '0.45',
+    # Pneumonia
+    'temperature': '99.1', 'cough_severity': '3', 'breathing_difficulty': '2', 'oxygen_level': '96'
+}
+
+SINGLE = [
+    ('heart', utils.validate_heart_disease_form, ml_models.predict_heart_disease),
+    ('diabetes', utils.validate_diabetes_form, ml_models.predict_diabetes),
+    ('pneumonia', utils.validate_pneumonia_form, ml_models.predict_pneumonia),
+]
+
+
+def save_sqlite_only(entries, one_transaction):
+    """SQLite half of save_prediction(s), for when MongoDB is not reachable."""
+    rows = [
+        Prediction(prediction_type=kind, result=json.dumps(result), confidence=result['probability'],
+                   input_data=json.dumps(data), created_at=datetime.utcnow())
+        for kind, result, data in entries
+    ]
+    if one_transaction:
+        db.session.add_all(rows)
+        db.session.commit()
+    else:
+        for row in rows:
+            db.session.add(row)
+            db.session.commit()
+
+
+def sequential(use_mongo):
+    entries = []
+    for kind, validate, predict in SINGLE:
+        _, _, cleaned = validate(FORM)
+        result = predict(cleaned)
+        if use_mongo:
+            utils.save_prediction(kind, result, cleaned)
+        else:
+            entries.append((kind, result, cleaned))
+            save_sqlite_only(entries[-1:], one_transaction=False)
+
+
+def combined(use_mongo):
+    _, _, cleaned = utils.validate_screening_form(FORM)
+    results = ml_models.predict_screening(cleaned)
+    entries = [(kind, results[kind], cleaned[kind]) for kind in results]
+    if use_mongo:
+        utils.save_predictions(entries)
+    else:
+        save_sqlite_only(entries, one_transaction=True)
+
+
+def score_sequential():
+    for kind, validate, predict in SINGLE:
+        predict(validate(FORM)[2])
+
+
+def score_combined():
+    ml_models.predict_screening(utils.validate_screening_form(FORM)[2])
+
+
+def timed(fn, visits):
+    fn()  # warm up
+    timings = []
+    for _ in range(visits):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def main():
+    visits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with app.app_context():
+        try:
+            mongo.cx.admin.command('ping')
+            use_mongo = True
+        except Exception:
+            use_mongo = False
+
+        print(f"{visits} visits, MongoDB {'included' if use_mongo else 'unreachable, SQLite only'}")
+        print(f"{'path':>22} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, fn in (('scoring, sequential', score_sequential), ('scoring, combined', score_combined),
+                         ('end to end, sequential', lambda: sequential(use_mongo)),
+                         ('end to end, combined', lambda: combined(use_mongo))):
+            p50, p95 = timed(fn, visits)
+            print(f"{name:>22} {p50:>8.2f} {p95:>8.2f}")
+        print("Per visit: sequential makes 3 SQLite commits, 3 MongoDB inserts and 6 HTTP requests "
+              "(3 POSTs + 3 result pages); combined makes 1 commit, 1 insert_many and 1 request.")
+
+
+if __name__ == '__main__':
+    main()
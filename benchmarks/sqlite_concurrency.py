@@ -0,0 +1,90 @@
+"""
+Concurrent-writer benchmark for the SQLite storage profile.
+
+Starts N threads that each commit prediction-sized rows one at a time, as
+save_prediction does, against a fresh database using the previous engine
+settings and then the production profile. Reports commits per second and
+the number of "database is locked" failures.
+
+Usage: python benchmarks/sqlite_concurrency.py [threads] [commits_per_thread]
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import storage
+
+ROW = {
+    'prediction_type': 'heart',
+    'result': json.dumps({'prediction': True, 'probability': 0.79, 'risk_level': 'High'}),
+    'confidence': 0.79,
+    'input_data': json.dumps({'age': 63, 'sex': 1, 'cp': 3, 'trestbps': 145, 'chol': 233}),
+}
+
+
+def run(engine, threads, commits):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE prediction (id INTEGER PRIMARY KEY, prediction_type VARCHAR(50), "
+            "result VARCHAR(100), confidence FLOAT, input_data TEXT, created_at DATETIME)"
+        ))
+
+    failures = [0] * threads
+
+    def writer(slot):
+        for _ in range(commits):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "INSERT INTO prediction (prediction_type, result, confidence, input_data, created_at) "
+                        "VALUES (:prediction_type, :result, :confidence, :input_data, CURRENT_TIMESTAMP)"
+                    ), ROW)
+                    # Readers share the file with writers in the web app
+                    conn.execute(text("SELECT COUNT(*) FROM prediction")).scalar()
+            except OperationalError:
+                failures[slot] += 1
+
+    workers = [threading.Thread(target=writer, args=(slot,)) for slot in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return (threads * commits - sum(failures)) / elapsed, sum(failures)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    commits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as workdir:
+        baseline_uri = f"sqlite:///{os.path.join(workdir, 'baseline.db')}"
+        baseline = create_engine(
+            baseline_uri,
+            pool_recycle=300,
+            pool_pre_ping=True,
+            # The stdlib default busy timeout, made explicit
+            connect_args={'timeout': 5, 'check_same_thread': False}
+        )
+        tuned_uri = f"sqlite:///{os.path.join(workdir, 'tuned.db')}"
+        tuned = create_engine(tuned_uri, **storage.engine_options(tuned_uri))
+        storage.apply_sqlite_profile(tuned)
+
+        print(f"{threads} threads x {commits} commits")
+        for name, engine in (('rollback journal', baseline), ('production profile', tuned)):
+            rate, failures = run(engine, threads, commits)
+            print(f"{name:>20}: {rate:8.1f} commits/s, {failures} locked failures")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Throughput and latency of the CPU-only chest X-ray pipeline.
+
+Generates synthetic 2048x2048 JPEG radiographs and measures:
+- preprocessing time with JPEG draft decoding versus a full-size decode
+- cold (decode + store) and warm (content-hash cache hit) request latency
+- images per second and the average batch size at several client thread counts
+
+Usage: python benchmarks/xray_throughput.py [images]
+"""
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+import ml_models
+import xray
+
+
+def synthetic_xray(rng, size=2048):
+    y, x = np.mgrid[0:size, 0:size] / size
+    # Bright mediastinum and ribcage, darker lung fields, random consolidation
+    pixels = 0.3 + 0.4 * np.exp(-((x - 0.5) ** 2) / 0.01) + 0.1 * np.sin(y * 40) ** 2
+    cx, cy = rng.uniform(0.2, 0.8, 2)
+    pixels += rng.uniform(0, 0.4) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / 0.02)
+    image = Image.fromarray((np.clip(pixels, 0, 1) * 255).astype(np.uint8))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def percentiles(timings):
+    timings = np.array(timings) * 1000
+    return f"p50 {np.percentile(timings, 50):7.2f} ms  p95 {np.percentile(timings, 95):7.2f} ms"
+
+
+def timed(fn, items):
+    timings = []
+    for item in items:
+        started = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def full_decode(data):
+    image = Image.open(io.BytesIO(data)).convert('L').resize((128, 128), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    rng = np.random.default_rng(0)
+    print(f"Generating {count * 4} synthetic 2048x2048 JPEGs...")
+    images = [synthetic_xray(rng) for _ in range(count * 4)]
+
+    ml_models.initialize_models()
+    with tempfile.TemporaryDirectory() as workdir:
+        xray.init_app(types.SimpleNamespace(config={}, instance_path=workdir))
+
+        print("Preprocess, full decode:   " + percentiles(timed(full_decode, images[:count])))
+        print("Preprocess, draft decode:  " + percentiles(timed(xray.preprocess, images[:count])))
+        print("Request, cold:             " + percentiles(timed(xray.predict, images[:count])))
+        print("Request, cached:           " + percentiles(timed(xray.predict, images[:count])))
+
+        pending = images[count:]
+        for threads in (1, 4, 16):
+            batch = [pending.pop() for _ in range(min(count, len(pending)))]
+            if not batch:
+                break
+            before = xray.stats()
+            chunks = [batch[i::threads] for i in range(threads)]
+            workers = [threading.Thread(target=lambda chunk: [xray.predict(data) for data in chunk], args=(chunk,))
+                       for chunk in chunks]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+            after = xray.stats()
+            batches = after['batches'] - before['batches']
+            scored = after['images'] - before['images']
+            print(f"{threads:>2} client threads: {len(batch) / elapsed:7.1f} images/s, "
+                  f"avg batch {scored / batches:5.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Shadow and canary evaluation of candidate model versions.
+
+A candidate for the heart or diabetes model is loaded from the pickle file
+named by CANDIDATE_HEART_MODEL / CANDIDATE_DIABETES_MODEL. The file holds
+either a fitted classifier, which is fed features scaled by the primary
+scaler, or a dict with 'model' and optionally 'scaler' and 'version'.
+
+Each candidate runs in one of three modes:
+
+- shadow: a CANDIDATE_SHADOW_RATE sample of requests is scored again by the
+  candidate on a background thread, after the primary result is ready. The
+  request never waits for it; when the shadow queue is full the sample is
+  dropped. Disagreement with the primary and latency are recorded.
+- canary: CANDIDATE_CANARY_PERCENT of requests are served by the candidate,
+  and the rest are shadowed as above. If the candidate's error rate or its
+  p95 latency relative to the primary regresses past the configured limits,
+  the canary is rolled back to shadow mode automatically.
+- off: the candidate is loaded but unused.
+
+Pickle files are trusted configuration: only point these settings at model
+files you produced.
+"""
+import logging
+import os
+import pickle
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+MODES = ('shadow', 'canary', 'off')
+
+_config = {
+    'shadow_rate': 0.1,
+    'canary_percent': 5.0,
+    'max_error_rate': 0.02,
+    'max_latency_ratio': 1.5,
+    'min_samples': 50,
+    'window': 500
+}
+_deployments = {}
+_executor = None
+_slots = None
+
+
+class _Deployment:
+    """A candidate model for one disease with its evaluation statistics."""
+
+    def __init__(self, disease, path, primary_scaler, mode):
+        with open(path, 'rb') as f:
+            loaded = pickle.load(f)
+        if isinstance(loaded, dict):
+            self.model = loaded['model']
+            self.scaler = loaded.get('scaler') or primary_scaler
+            self.version = str(loaded.get('version') or os.path.basename(path))
+        else:
+            self.model = loaded
+            self.scaler = primary_scaler
+            self.version = os.path.basename(path)
+
+        self.disease = disease
+        self.mode = mode
+        self.rollback_reason = None
+        self._lock = threading.Lock()
+        self._primary_latency = deque(maxlen=_config['window'])
+        self._shadow_latency = deque(maxlen=_config['window'])
+        self._canary = deque(maxlen=_config['window'])
+        self._counts = {
+            'shadowed': 0,
+            'shadow_dropped': 0,
+            'shadow_errors': 0,
+            'disagreements': 0,
+            'canary_served': 0,
+            'canary_errors': 0
+        }
+        self._abs_diff_sum = 0.0
+        self._max_abs_diff = 0.0
+
+    def score(self, X):
+        return self.model.predict_proba(self.scaler.transform(X))[:, 1]
+
+    def serve(self, X):
+        """
+        Score a canary request.
+
+        Returns:
+            np.ndarray: Candidate probabilities, or None if the candidate failed
+        """
+        started = time.perf_counter()
+        try:
+            probabilities = self.score(X)
+            ok = True
+        except Exception as e:
+            logging.error(f"Candidate {self.version} failed on canary request: {str(e)}")
+            probabilities = None
+            ok = False
+        with self._lock:
+            self._canary.append((time.perf_counter() - started, ok))
+            self._counts['canary_served'] += 1
+            self._counts['canary_errors'] += int(not ok)
+        self._check_rollback()
+        return probabilities
+
+    def compare(self, X, primary_probabilities):
+        """Score X with the candidate and record how it differs from the primary."""
+        started = time.perf_counter()
+        try:
+            probabilities = self.score(X)
+        except Exception as e:
+            logging.error(f"Candidate {self.version} failed on shadow request: {str(e)}")
+            with self._lock:
+                self._counts['shadow_errors'] += 1
+            return
+        elapsed = time.perf_counter() - started
+
+        diff = np.abs(probabilities - primary_probabilities)
+        disagreements = int(np.sum((probabilities > 0.5) != (primary_probabilities > 0.5)))
+        with self._lock:
+            self._shadow_latency.append(elapsed)
+            self._counts['shadowed'] += len(diff)
+            self._counts['disagreements'] += disagreements
+            self._abs_diff_sum += float(diff.sum())
+            self._max_abs_diff = max(self._max_abs_diff, float(diff.max()))
+
+    def _check_rollback(self):
+        with self._lock:
+            if self.mode != 'canary' or len(self._canary) < _config['min_samples']:
+                return
+            canary = list(self._canary)
+            primary = list(self._primary_latency)
+
+        error_rate = sum(1 for _, ok in canary if not ok) / len(canary)
+        reason = None
+        if error_rate > _config['max_error_rate']:
+            reason = f"error rate {error_rate:.1%} exceeds {_config['max_error_rate']:.1%}"
+        elif len(primary) >= _config['min_samples']:
+            ratio = np.percentile([seconds for seconds, _ in canary], 95) / max(np.percentile(primary, 95), 1e-9)
+            if ratio > _config['max_latency_ratio']:
+                reason = f"p95 latency is {ratio:.2f}x the primary, limit {_config['max_latency_ratio']}x"
+
+        if reason is not None:
+            with self._lock:
+                if self.mode != 'canary':
+                    return
+                self.mode = 'shadow'
+                self.rollback_reason = reason
+            logging.warning(f"Rolled back {self.disease} canary {self.version}: {reason}")
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            primary = list(self._primary_latency)
+            shadow = list(self._shadow_latency)
+            canary = [seconds for seconds, _ in self._canary]
+            abs_diff_sum = self._abs_diff_sum
+            max_abs_diff = self._max_abs_diff
+
+        def latency(samples):
+            if not samples:
+                return None
+            return {
+                'p50_ms': round(float(np.percentile(samples, 50)) * 1000, 3),
+                'p95_ms': round(float(np.percentile(samples, 95)) * 1000, 3)
+            }
+
+        shadowed = counts['shadowed']
+        counts.update({
+            'version': self.version,
+            'mode': self.mode,
+            'rollback_reason': self.rollback_reason,
+            'disagreement_rate': round(counts['disagreements'] / shadowed, 4) if shadowed else 0.0,
+            'mean_abs_probability_diff': round(abs_diff_sum / shadowed, 4) if shadowed else 0.0,
+            'max_abs_probability_diff': round(max_abs_diff, 4),
+            'latency': {'primary': latency(primary), 'shadow': latency(shadow), 'canary': latency(canary)}
+        })
+        return counts
+
+
+def init_app(app, primary_scalers):
+    """
+    Load the configured candidate models and start the shadow scoring thread.
+
+    Args:
+        app (Flask): Application providing the CANDIDATE_* config
+        primary_scalers (dict): Primary scaler per disease, used when a candidate has none
+    """
+    global _executor, _slots
+    _config['shadow_rate'] = app.config.get('CANDIDATE_SHADOW_RATE', 0.1)
+    _config['canary_percent'] = app.config.get('CANDIDATE_CANARY_PERCENT', 5.0)
+    _config['max_error_rate'] = app.config.get('CANDIDATE_MAX_ERROR_RATE', 0.02)
+    _config['max_latency_ratio'] = app.config.get('CANDIDATE_MAX_LATENCY_RATIO', 1.5)
+    _config['min_samples'] = app.config.get('CANDIDATE_MIN_SAMPLES', 50)
+    mode = app.config.get('CANDIDATE_MODE', 'shadow')
+
+    for disease, key in (('heart', 'CANDIDATE_HEART_MODEL'), ('diabetes', 'CANDIDATE_DIABETES_MODEL')):
+        path = app.config.get(key)
+        if not path:
+            continue
+        try:
+            _deployments[disease] = _Deployment(disease, path, primary_scalers[disease], mode)
+            logging.info(f"Loaded {disease} candidate {_deployments[disease].version} in {mode} mode")
+        except Exception as e:
+            # A broken candidate must never take the primary model down with it
+            logging.error(f"Error loading {disease} candidate from {path}: {str(e)}")
+
+    if _deployments and _executor is None:
+        # One thread keeps shadow scoring from competing with request threads for CPU
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        _slots = threading.BoundedSemaphore(app.config.get('CANDIDATE_QUEUE_SIZE', 256))
+
+def canary(disease):
+    """The candidate deployment that should serve this request, or None for the primary."""
+    deployment = _deployments.get(disease)
+    if deployment is None or deployment.mode != 'canary':
+        return None
+    if random.random() * 100 >= _config['canary_percent']:
+        return None
+    return deployment
+
+def shadow(disease, X, probabilities, seconds):
+    """
+    Record a primary scoring call and maybe queue it for shadow comparison.
+
+    Args:
+        disease (str): 'heart' or 'diabetes'
+        X (np.ndarray): Raw feature matrix that was scored
+        probabilities (np.ndarray): Primary model probabilities for X
+        seconds (float): Primary scoring latency
+    """
+    deployment = _deployments.get(disease)
+    if deployment is None:
+        return
+    with deployment._lock:
+        deployment._primary_latency.append(seconds)
+    if deployment.mode == 'off' or random.random() >= _config['shadow_rate']:
+        return
+    if not _slots.acquire(blocking=False):
+        with deployment._lock:
+            deployment._counts['shadow_dropped'] += 1
+        return
+    future = _executor.submit(deployment.compare, X.copy(), np.array(probabilities, copy=True))
+    future.add_done_callback(lambda _: _slots.release())
+
+def set_mode(disease, mode):
+    """
+    Switch a candidate between shadow, canary and off, clearing any rollback.
+
+    Raises:
+        KeyError: No candidate is loaded for disease
+        ValueError: Unknown mode
+    """
+    if mode not in MODES:
+        raise ValueError(f"Mode must be one of {', '.join(MODES)}")
+    deployment = _deployments[disease]
+    with deployment._lock:
+        deployment.mode = mode
+        deployment.rollback_reason = None
+        deployment._canary.clear()
+    logging.info(f"{disease} candidate {deployment.version} switched to {mode} mode")
+
+def stats():
+    """Evaluation statistics for every loaded candidate."""
+    return {
+        'config': dict(_config),
+        'candidates': {disease: deployment.stats() for disease, deployment in _deployments.items()}
+    }
@@ -0,0 +1,282 @@
+"""
+Streaming input-drift monitor.
+
+Every validated feature vector is folded into constant-size, mergeable
+sketches: a fixed-bin histogram plus count/sum/sum-of-squares per feature,
+and per-minute prediction counts per disease. Bin edges are laid out in
+standard deviations around the fitted scalers' mean_/scale_, so each update
+is O(1) and the histogram can be compared directly against the reference
+normal distribution with PSI and a binned KS statistic.
+
+Sketches are kept per hour for the last DRIFT_WINDOW_HOURS, so the report
+describes recent traffic rather than everything since the process started.
+
+Each worker periodically writes its sketches to a JSON file in the instance
+folder, named by host, pid and a per-process token so a reused pid never
+overwrites another worker's file. The admin report adds up the in-window
+hours of every file binned against the current model reference. Files not
+written for longer than the window belong to exited workers and are
+removed.
+"""
+import atexit
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+
+import numpy as np
+
+import ml_models
+
+# Bin edges at -4..+4 standard deviations in half-sigma steps, plus two tail bins
+EDGE_SIGMAS = np.linspace(-4, 4, 17)
+N_BINS = len(EDGE_SIGMAS) + 1
+RATE_WINDOW_MINUTES = 60
+BUCKET_SECONDS = 3600
+PSI_WARN = 0.1
+PSI_DRIFT = 0.25
+
+
+def _normal_cdf(z):
+    return 0.5 * (1 + math.erf(z / math.sqrt(2)))
+
+
+# Reference bin probabilities and CDF at the edges under N(mean_, scale_)
+EXPECTED_CDF = np.array([_normal_cdf(z) for z in EDGE_SIGMAS])
+EXPECTED = np.diff(np.concatenate(([0.0], EXPECTED_CDF, [1.0])))
+
+_state = {}
+_rates = {}
+_lock = threading.Lock()
+_config = {'directory': None, 'flush_interval': 60, 'window_hours': 24}
+_last_flush = time.monotonic()
+_file = {'pid': None, 'path': None}
+
+
+def init_app(app):
+    """Configure the flush directory and interval from the Flask app."""
+    directory = os.path.join(app.instance_path, 'drift')
+    os.makedirs(directory, exist_ok=True)
+    _config['directory'] = directory
+    _config['flush_interval'] = app.config.get('DRIFT_FLUSH_INTERVAL', 60)
+    _config['window_hours'] = app.config.get('DRIFT_WINDOW_HOURS', 24)
+    atexit.register(flush)
+
+def _reference(disease):
+    """Feature names, reference means and scales for a disease model."""
+    if disease == 'heart':
+        return ml_models.HEART_FEATURES, ml_models.heart_scaler.mean_, ml_models.heart_scaler.scale_
+    if disease == 'diabetes':
+        return ml_models.DIABETES_FEATURES, ml_models.diabetes_scaler.mean_, ml_models.diabetes_scaler.scale_
+    return None
+
+def _new_sketch(features, mean, scale):
+    n = len(features)
+    return {
+        'features': list(features),
+        'mean': mean.tolist(),
+        'scale': scale.tolist(),
+        'count': 0,
+        'sum': np.zeros(n),
+        'sumsq': np.zeros(n),
+        'hist': np.zeros((n, N_BINS), dtype=np.int64)
+    }
+
+def observe(disease, features, prediction):
+    """
+    Fold one validated input and its prediction into the sketches.
+
+    Args:
+        disease (str): 'heart', 'diabetes' or 'pneumonia'
+        features (dict): Cleaned form data
+        prediction (bool): Predicted class
+    """
+    try:
+        minute = int(time.time() // 60)
+        with _lock:
+            rate = _rates.setdefault(disease, {})
+            bucket = rate.setdefault(minute, [0, 0])
+            bucket[0] += 1
+            bucket[1] += int(bool(prediction))
+            if len(rate) > RATE_WINDOW_MINUTES:
+                del rate[min(rate)]
+
+            reference = _reference(disease)
+            if reference is not None:
+                names, mean, scale = reference
+                hour = int(time.time() // BUCKET_SECONDS)
+                buckets = _state.setdefault(disease, {})
+                sketch = buckets.get(hour)
+                if sketch is None or sketch['mean'] != mean.tolist():
+                    # New hour, or the models were retrained on new reference data
+                    sketch = buckets[hour] = _new_sketch(names, mean, scale)
+                    for old in [h for h in buckets if h <= hour - _config['window_hours']]:
+                        del buckets[old]
+                x = np.array([features.get(name, 0) for name in names], dtype=float)
+                z = (x - mean) / scale
+                bins = np.searchsorted(EDGE_SIGMAS, z, side='right')
+                sketch['count'] += 1
+                sketch['sum'] += x
+                sketch['sumsq'] += x * x
+                sketch['hist'][np.arange(len(names)), bins] += 1
+        _maybe_flush()
+    except Exception as e:
+        # Monitoring must never break a prediction
+        logging.error(f"Error updating drift sketches: {str(e)}")
+
+def _maybe_flush():
+    global _last_flush
+    if _config['directory'] is None:
+        return
+    now = time.monotonic()
+    if now - _last_flush < _config['flush_interval']:
+        return
+    _last_flush = now
+    flush()
+
+def _snapshot():
+    with _lock:
+        return {
+            'sketches': {
+                disease: {
+                    str(hour): {
+                        key: value.tolist() if isinstance(value, np.ndarray) else value
+                        for key, value in sketch.items()
+                    }
+                    for hour, sketch in buckets.items()
+                }
+                for disease, buckets in _state.items()
+            },
+            'rates': {disease: {str(m): list(c) for m, c in rate.items()} for disease, rate in _rates.items()}
+        }
+
+def _path():
+    # Regenerated after a fork so each process writes its own file
+    if _file['pid'] != os.getpid():
+        name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        _file.update(pid=os.getpid(), path=os.path.join(_config['directory'], name))
+    return _file['path']
+
+def flush():
+    """Write this worker's windowed sketches to its file in the drift directory."""
+    if _config['directory'] is None:
+        return
+    path = _path()
+    try:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.error(f"Error flushing drift sketches: {str(e)}")
+
+def _merged():
+    """Merge the in-window sketches from every worker, including this one."""
+    flush()
+    snapshots = []
+    directory = _config['directory']
+    if directory is not None:
+        expired_before = time.time() - _config['window_hours'] * 3600 - _config['flush_interval']
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < expired_before:
+                    # Not written for a whole window: the worker has exited
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    else:
+        snapshots.append(_snapshot())
+
+    oldest = int(time.time() // BUCKET_SECONDS) - _config['window_hours']
+    references = {}
+    for disease in ('heart', 'diabetes'):
+        reference = _reference(disease)
+        if reference is not None:
+            references[disease] = (reference[1].tolist(), reference[2].tolist())
+
+    sketches, rates = {}, {}
+    for snapshot in snapshots:
+        for disease, buckets in snapshot['sketches'].items():
+            if disease not in references or not isinstance(buckets, dict) or 'mean' in buckets:
+                continue  # No reference, or a file written before hourly buckets
+            mean, scale = references[disease]
+            for hour, sketch in buckets.items():
+                # Sketches binned against another reference cannot be added
+                if int(hour) <= oldest or sketch['mean'] != mean or sketch['scale'] != scale:
+                    continue
+                merged = sketches.get(disease)
+                if merged is None:
+                    sketches[disease] = {
+                        key: np.array(value) if key in ('sum', 'sumsq', 'hist') else value
+                        for key, value in sketch.items()
+                    }
+                    continue
+                merged['count'] += sketch['count']
+                for key in ('sum', 'sumsq', 'hist'):
+                    merged[key] = merged[key] + np.array(sketch[key])
+        for disease, rate in snapshot['rates'].items():
+            merged_rate = rates.setdefault(disease, {})
+            for minute, (total, positive) in rate.items():
+                counts = merged_rate.setdefault(int(minute), [0, 0])
+                counts[0] += total
+                counts[1] += positive
+    return sketches, rates
+
+def report():
+    """
+    Merged drift report comparing observed inputs to the scaler reference.
+
+    Returns:
+        dict: Per-disease feature statistics with PSI/KS scores and recent prediction rates
+    """
+    sketches, rates = _merged()
+    diseases = {}
+    for disease, sketch in sketches.items():
+        count = sketch['count']
+        if not count:
+            continue
+        mean = sketch['sum'] / count
+        variance = np.maximum(sketch['sumsq'] / count - mean ** 2, 0)
+        features = []
+        for i, name in enumerate(sketch['features']):
+            observed = sketch['hist'][i] / count
+            # Floor empty bins so PSI stays finite
+            actual = np.maximum(observed, 1e-4)
+            psi = float(np.sum((actual - EXPECTED) * np.log(actual / EXPECTED)))
+            ks = float(np.max(np.abs(np.cumsum(observed)[:-1] - EXPECTED_CDF)))
+            features.append({
+                'feature': name,
+                'reference_mean': round(sketch['mean'][i], 4),
+                'reference_std': round(sketch['scale'][i], 4),
+                'observed_mean': round(float(mean[i]), 4),
+                'observed_std': round(float(math.sqrt(variance[i])), 4),
+                'psi': round(psi, 4),
+                'ks': round(ks, 4),
+                'status': 'drift' if psi >= PSI_DRIFT else ('warn' if psi >= PSI_WARN else 'ok')
+            })
+        diseases[disease] = {'count': count, 'window_hours': _config['window_hours'], 'features': features}
+
+    prediction_rates = {}
+    oldest = int(time.time() // 60) - RATE_WINDOW_MINUTES
+    for disease, rate in rates.items():
+        # Files from workers that have since exited can hold old minutes
+        rate = {minute: counts for minute, counts in rate.items() if minute > oldest}
+        total = sum(counts[0] for counts in rate.values())
+        positive = sum(counts[1] for counts in rate.values())
+        prediction_rates[disease] = {
+            'window_minutes': RATE_WINDOW_MINUTES,
+            'predictions': total,
+            'positive_rate': round(positive / total, 4) if total else 0.0,
+            'per_minute': {str(minute): counts for minute, counts in sorted(rate.items())}
+        }
+    return {'diseases': diseases, 'prediction_rates': prediction_rates}
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, BooleanField
-from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, DateField
+from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Optional
 from models import User
 
 class RegistrationForm(FlaskForm):
@@ -27,4 +27,10 @@ class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     password = PasswordField('Password', validators=[DataRequired()])
     remember = BooleanField('Remember Me')
-    submit = SubmitField('Login')
\ No newline at end of file
+    submit = SubmitField('Login')
+
+class PatientForm(FlaskForm):
+    name = StringField('Name', validators=[DataRequired(), Length(max=120)])
+    reference = StringField('Record Number', validators=[Optional(), Length(max=64)])
+    date_of_birth = DateField('Date of Birth', validators=[Optional()])
+    submit = SubmitField('Add Patient')
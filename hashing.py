@@ -0,0 +1,156 @@
+"""
+Password hashing executor.
+
+bcrypt deliberately burns ~250 ms of CPU per hash. Running it directly on web
+threads lets a burst of logins occupy every worker thread and starve
+prediction traffic. PasswordHasher runs hashes on a small dedicated thread
+pool (bcrypt releases the GIL while hashing), admits work through a token
+bucket and a bounded queue, and rejects the excess immediately with
+HashingBusy instead of letting it pile up.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class HashingBusy(Exception):
+    """Raised when a hash request is not admitted; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate tokens per second."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Try to take one token.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def refund(self):
+        """Give back a token whose work was rejected after it was taken."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class PasswordHasher:
+    """
+    Run Flask-Bcrypt hashing and verification on a bounded executor.
+
+    Configuration keys:
+        BCRYPT_LOG_ROUNDS: bcrypt cost factor for new hashes
+        HASHING_WORKERS: threads dedicated to hashing
+        HASHING_QUEUE_SIZE: hashes allowed to wait behind the running ones
+        HASHING_RATE / HASHING_BURST: admission token bucket
+        HASHING_TIMEOUT: seconds a caller waits for its hash
+    """
+
+    def __init__(self, bcrypt, app=None):
+        self.bcrypt = bcrypt
+        self.rounds = 12
+        self.timeout = 10
+        self._executor = None
+        self._slots = None
+        self._bucket = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.busy_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.get('HASHING_WORKERS', 2)
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.timeout = app.config.get('HASHING_TIMEOUT', 10)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + app.config.get('HASHING_QUEUE_SIZE', 16))
+        self._bucket = TokenBucket(app.config.get('HASHING_RATE', 20), app.config.get('HASHING_BURST', 40))
+
+    def hash(self, password):
+        """Return a bcrypt hash of password at the configured cost."""
+        return self._run(self.bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def verify(self, pw_hash, password):
+        """Check password against pw_hash."""
+        if not pw_hash:
+            return False
+        return self._run(self.bcrypt.check_password_hash, pw_hash, password)
+
+    def rehash(self, password):
+        """Hash password again at the configured cost, counting the upgrade."""
+        pw_hash = self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return pw_hash
+
+    def needs_rehash(self, pw_hash):
+        """True if pw_hash was made with a cost factor other than the configured one."""
+        try:
+            # Format: $2b$<cost>$<salt+hash>
+            return int(pw_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'avg_ms': round(self.busy_seconds * 1000 / self.completed, 1) if self.completed else 0.0
+            }
+
+    def _run(self, fn, *args):
+        wait = self._bucket.take()
+        if wait:
+            self._reject("Hashing rate limit reached", wait)
+        if not self._slots.acquire(blocking=False):
+            # Nothing ran, so the rejection does not count against the rate
+            self._bucket.refund()
+            self._reject("Hashing queue is full", 1)
+
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            self._reject(f"Hash did not complete within {self.timeout}s", 1)
+        with self._lock:
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - started
+        return result
+
+    def _reject(self, message, retry_after):
+        with self._lock:
+            self.rejected += 1
+        logging.warning(f"Password hashing rejected: {message}")
+        raise HashingBusy(message, retry_after=max(1, int(retry_after + 0.999)))
@@ -0,0 +1,195 @@
+"""
+HTTP caching for semi-static pages and static assets.
+
+Pages such as / and /about render the same HTML for every anonymous visitor,
+so cached_page keeps the rendered body (plus a gzip copy) per endpoint and
+auth state and answers later anonymous requests without rendering. Static
+assets are compressed once at start-up (gzip, and brotli when the optional
+brotli package is installed), served with strong ETags, and url_for('static')
+URLs carry a content hash so browsers can cache them as immutable.
+"""
+import functools
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.xml'}
+# Below this size the encoding headers cost more than compression saves
+MIN_COMPRESS_BYTES = 512
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_pages = {}
+_assets = {}
+_versions = {}
+_lock = threading.Lock()
+_metrics = {
+    'page_hits': 0,
+    'page_misses': 0,
+    'page_bypassed': 0,
+    'render_ms_saved': 0.0,
+    'static_compressed_hits': 0,
+    'static_not_modified': 0,
+    'bytes_uncompressed': 0,
+    'bytes_sent': 0
+}
+
+
+def _count(**increments):
+    with _lock:
+        for name, value in increments.items():
+            _metrics[name] += value
+
+def _accepted_encodings():
+    return {part.split(';')[0].strip() for part in request.headers.get('Accept-Encoding', '').split(',')}
+
+def _cacheable_request():
+    if request.method != 'GET' or current_user.is_authenticated:
+        return False
+    # Pending flash messages are rendered into the page exactly once
+    if '_flashes' in session:
+        return False
+    return current_app.config.get('PAGE_CACHE_ENABLED', True) and not current_app.debug
+
+def cached_page(view):
+    """
+    Cache the rendered output of a view for anonymous visitors.
+
+    The cache key is the endpoint plus the auth state; authenticated users
+    always get a fresh render since the navbar shows their username.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _cacheable_request():
+            _count(page_bypassed=1)
+            return view(*args, **kwargs)
+
+        key = (request.endpoint, 'anonymous')
+        page = _pages.get(key)
+        if page is None:
+            started = time.perf_counter()
+            response = make_response(view(*args, **kwargs))
+            render_seconds = time.perf_counter() - started
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            page = {
+                'body': body,
+                'gzip': gzip.compress(body, compresslevel=6),
+                'etag': hashlib.sha1(body).hexdigest(),
+                'mimetype': response.mimetype,
+                'render_seconds': render_seconds
+            }
+            _pages[key] = page
+            _count(page_misses=1)
+        else:
+            _count(page_hits=1, render_ms_saved=page['render_seconds'] * 1000)
+
+        return _respond(page['body'], page.get('gzip'), page['etag'], page['mimetype'], cache_control='no-cache')
+    return wrapper
+
+def _respond(body, gzipped, etag, mimetype, cache_control, brotli_body=None):
+    """Build a response choosing the best accepted encoding and honouring If-None-Match."""
+    encodings = _accepted_encodings()
+    if brotli_body is not None and 'br' in encodings:
+        encoding, payload = 'br', brotli_body
+    elif gzipped is not None and 'gzip' in encodings:
+        encoding, payload = 'gzip', gzipped
+    else:
+        encoding, payload = None, body
+
+    tag = f"{etag}-{encoding}" if encoding else etag
+    if request.if_none_match.contains(tag):
+        response = make_response('', 304)
+        _count(static_not_modified=1, bytes_uncompressed=len(body))
+    else:
+        response = make_response(payload)
+        response.mimetype = mimetype
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        _count(bytes_uncompressed=len(body), bytes_sent=len(payload))
+
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+def precompress_static(app):
+    """
+    Compress every compressible static file once and install the caching static view.
+
+    Args:
+        app (Flask): Application whose static folder is served
+    """
+    static_folder = app.static_folder
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                body = f.read()
+            digest = hashlib.sha1(body).hexdigest()
+            _versions[filename] = digest[:12]
+
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS or len(body) < MIN_COMPRESS_BYTES:
+                continue
+            _assets[filename] = {
+                'body': body,
+                'gzip': gzip.compress(body, compresslevel=9),
+                'br': brotli.compress(body) if brotli is not None else None,
+                'etag': digest,
+                'mimetype': mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            }
+
+    send_static = app.view_functions['static']
+
+    def static(filename):
+        # Versioned URLs never change content, so browsers may cache them forever
+        version = request.args.get('v')
+        if version is not None and version == _versions.get(filename):
+            cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            cache_control = 'public, no-cache'
+
+        asset = _assets.get(filename)
+        if asset is None:
+            response = send_static(filename=filename)
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        _count(static_compressed_hits=1)
+        return _respond(asset['body'], asset['gzip'], asset['etag'], asset['mimetype'], cache_control, brotli_body=asset['br'])
+
+    app.view_functions['static'] = static
+
+    @app.url_defaults
+    def add_static_version(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            version = _versions.get(values.get('filename'))
+            if version:
+                values['v'] = version
+
+    saved = sum(len(a['body']) - len(a['gzip']) for a in _assets.values())
+    logging.info(f"Precompressed {len(_assets)} static assets, gzip saves {saved} bytes per full load")
+
+def stats():
+    """Caching counters, including bytes and render time saved."""
+    with _lock:
+        metrics = dict(_metrics)
+    metrics['render_ms_saved'] = round(metrics['render_ms_saved'], 2)
+    metrics['bytes_saved'] = metrics['bytes_uncompressed'] - metrics['bytes_sent']
+    metrics['cached_pages'] = len(_pages)
+    metrics['precompressed_assets'] = len(_assets)
+    metrics['brotli'] = brotli is not None
+    return metrics
@@ -0,0 +1,351 @@
+"""
+Process-pool inference backend.
+
+Random forest scoring holds the GIL, so a threaded web worker can only use one
+core for inference. This backend keeps a pool of pre-warmed worker processes
+that load the models once at start-up. Feature matrices are exchanged through
+a shared-memory buffer owned by each worker, so only a tiny control message
+crosses the pipe per call.
+
+The pool belongs to the web process that configured it. Every gunicorn
+worker starts its own INFERENCE_PROCESSES workers (cpu_count by default),
+so size it as cores / web workers. Under 'python main.py' with debug=True
+the reloader parent builds the app too and keeps a second, idle pool.
+"""
+import atexit
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shape of the per-worker shared buffer: inputs followed by outputs
+MAX_BATCH_ROWS = 256
+MAX_FEATURES = 16
+_INPUT_BYTES = MAX_BATCH_ROWS * MAX_FEATURES * 8
+_OUTPUT_BYTES = MAX_BATCH_ROWS * 8
+
+# Active pool, if any
+pool = None
+
+
+class InferenceWorkerError(RuntimeError):
+    """Raised when a worker process dies, hangs or cannot be reached."""
+
+
+def _buffer_views(buf):
+    inputs = np.ndarray((MAX_BATCH_ROWS, MAX_FEATURES), dtype=np.float64, buffer=buf)
+    outputs = np.ndarray((MAX_BATCH_ROWS,), dtype=np.float64, buffer=buf, offset=_INPUT_BYTES)
+    return inputs, outputs
+
+
+def _worker_main(conn, shm_name):
+    """Entry point of a worker process: load models once, then serve requests."""
+    import ml_models
+
+    ml_models.initialize_models()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    inputs, outputs = _buffer_views(shm.buf)
+    conn.send(('ready', os.getpid()))
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+
+            command = message[0]
+            if command == 'stop':
+                break
+            if command == 'ping':
+                conn.send(('pong', os.getpid()))
+                continue
+
+            _, disease, rows, cols = message
+            try:
+                outputs[:rows] = ml_models.score_probabilities(disease, inputs[:rows, :cols])
+                conn.send(('ok', rows))
+            except Exception as e:
+                conn.send(('error', str(e)))
+    finally:
+        del inputs, outputs
+        shm.close()
+
+
+class _Worker:
+    """A worker process together with its pipe and shared-memory buffer."""
+
+    def __init__(self, ctx, index):
+        self.index = index
+        self.shm = shared_memory.SharedMemory(create=True, size=_INPUT_BYTES + _OUTPUT_BYTES)
+        self.inputs, self.outputs = _buffer_views(self.shm.buf)
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.shm.name),
+            name=f'inference-worker-{index}',
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.started_at = time.time()
+        self.calls = 0
+        self.closed = False
+
+    def wait_ready(self, timeout):
+        try:
+            if not self.conn.poll(timeout):
+                raise InferenceWorkerError(f"Worker {self.index} did not start within {timeout}s")
+            status, _ = self.conn.recv()
+        except (EOFError, OSError):
+            status = None
+        if status != 'ready':
+            raise InferenceWorkerError(f"Worker {self.index} failed to start")
+
+    def ping(self, timeout):
+        try:
+            self.conn.send(('ping',))
+            if not self.conn.poll(timeout):
+                return False
+            status, _ = self.conn.recv()
+            return status == 'pong'
+        except (EOFError, OSError):
+            return False
+
+    def score(self, disease, X, timeout):
+        rows, cols = X.shape
+        self.inputs[:rows, :cols] = X
+        try:
+            self.conn.send(('score', disease, rows, cols))
+            if not self.conn.poll(timeout):
+                raise InferenceWorkerError(f"Worker {self.index} timed out after {timeout}s")
+            status, payload = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise InferenceWorkerError(f"Worker {self.index} crashed: {str(e)}")
+        if status == 'error':
+            raise ValueError(payload)
+        self.calls += 1
+        return self.outputs[:rows].copy()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.process.is_alive():
+                self.conn.send(('stop',))
+                self.process.join(1)
+        except OSError:
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        self.conn.close()
+        del self.inputs, self.outputs
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ProcessInferencePool:
+    """
+    Serve predict_proba calls from a fixed set of pre-warmed processes.
+
+    Workers are handed out through a thread-safe idle queue, so each web thread
+    has exclusive use of one worker and its buffer for the duration of a call.
+    A background thread pings idle workers and replaces any that have died.
+    """
+
+    def __init__(self, processes=None, timeout=5.0, start_timeout=60.0, health_interval=10.0):
+        self.processes = processes or os.cpu_count() or 1
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.health_interval = health_interval
+        self.restarts = 0
+        self._ctx = mp.get_context('spawn')
+        self._workers = {}
+        self._down = {}
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._monitor = None
+
+    def start(self):
+        workers = [_Worker(self._ctx, index) for index in range(self.processes)]
+        for worker in workers:
+            worker.wait_ready(self.start_timeout)
+            self._workers[worker.index] = worker
+            self._idle.put(worker)
+
+        self._monitor = threading.Thread(target=self._monitor_loop, name='inference-health', daemon=True)
+        self._monitor.start()
+        logging.info(f"Inference pool started with {self.processes} worker processes")
+
+    def predict_proba(self, disease, X):
+        """
+        Return positive-class probabilities for the raw feature matrix X.
+
+        Raises:
+            InferenceWorkerError: If no worker is available or the worker failed
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] > MAX_FEATURES:
+            raise ValueError(f"Feature matrix must be 2-D with at most {MAX_FEATURES} columns")
+        if X.shape[0] > MAX_BATCH_ROWS:
+            return np.concatenate([
+                self.predict_proba(disease, X[start:start + MAX_BATCH_ROWS])
+                for start in range(0, X.shape[0], MAX_BATCH_ROWS)
+            ])
+
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise InferenceWorkerError(f"No inference worker free within {self.timeout}s")
+
+        try:
+            probabilities = worker.score(disease, X, self.timeout)
+        except InferenceWorkerError:
+            # Respawning takes seconds; do it off the request thread
+            threading.Thread(target=self._replace, args=(worker,), daemon=True).start()
+            raise
+        except Exception:
+            self._idle.put(worker)
+            raise
+        self._idle.put(worker)
+        return probabilities
+
+    def health(self):
+        """Return a JSON-serialisable snapshot of worker state."""
+        with self._lock:
+            workers = list(self._workers.values())
+        return {
+            'backend': 'process',
+            'processes': self.processes,
+            'idle': self._idle.qsize(),
+            'down': len(self._down),
+            'restarts': self.restarts,
+            'workers': [
+                {
+                    'index': worker.index,
+                    'pid': worker.process.pid,
+                    'alive': worker.process.is_alive(),
+                    'calls': worker.calls,
+                    'uptime_seconds': round(time.time() - worker.started_at, 1)
+                }
+                for worker in workers
+            ]
+        }
+
+    def shutdown(self):
+        self._stopped.set()
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+
+    def _restart(self, worker):
+        """
+        Replace a worker process.
+
+        Returns:
+            _Worker: The replacement once it has answered a health ping, or None if it
+            did not; the slot is then kept out of the idle queue and retried by the monitor
+        """
+        logging.warning(f"Restarting inference worker {worker.index} (pid {worker.process.pid})")
+        worker.close()
+        if self._stopped.is_set():
+            return None
+        replacement = _Worker(self._ctx, worker.index)
+        healthy = True
+        try:
+            replacement.wait_ready(self.start_timeout)
+            if not replacement.ping(self.timeout):
+                raise InferenceWorkerError(f"Worker {worker.index} did not answer a health ping")
+        except InferenceWorkerError as e:
+            logging.error(f"Inference worker {worker.index} failed to restart: {str(e)}")
+            healthy = False
+        with self._lock:
+            if self._stopped.is_set():
+                replacement.close()
+                return None
+            self._workers[worker.index] = replacement
+            self.restarts += 1
+            if not healthy:
+                self._down[worker.index] = replacement
+                return None
+            self._down.pop(worker.index, None)
+        return replacement
+
+    def _replace(self, worker):
+        replacement = self._restart(worker)
+        if replacement is not None:
+            self._idle.put(replacement)
+
+    def _monitor_loop(self):
+        while not self._stopped.wait(self.health_interval):
+            # Retry slots whose last restart failed
+            with self._lock:
+                down = list(self._down.values())
+            for worker in down:
+                try:
+                    self._replace(worker)
+                except Exception as e:
+                    logging.error(f"Inference worker restart failed: {str(e)}")
+
+            # Check only idle workers so busy ones are never interrupted
+            for _ in range(self._idle.qsize()):
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if not worker.process.is_alive() or not worker.ping(self.timeout):
+                        worker = self._restart(worker)
+                except Exception as e:
+                    logging.error(f"Inference health check failed: {str(e)}")
+                finally:
+                    if worker is not None:
+                        self._idle.put(worker)
+
+
+def configure(config):
+    """
+    Install the inference backend selected by INFERENCE_BACKEND.
+
+    'inline' (the default) scores inside the web process; 'process' serves
+    predictions from a ProcessInferencePool.
+    """
+    global pool
+    import ml_models
+
+    # Never start a nested pool from inside a worker process
+    if mp.parent_process() is not None or pool is not None:
+        return
+
+    backend = config.get('INFERENCE_BACKEND', 'inline')
+    if backend == 'inline':
+        return
+    if backend != 'process':
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    pool = ProcessInferencePool(
+        processes=config.get('INFERENCE_PROCESSES'),
+        timeout=config.get('INFERENCE_TIMEOUT', 5.0)
+    )
+    pool.start()
+    atexit.register(pool.shutdown)
+    ml_models.inference_backend = pool
+
+
+def health():
+    """Health snapshot of the active backend."""
+    if pool is None:
+        return {'backend': 'inline'}
+    return pool.health()
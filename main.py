@@ -1,4 +1,7 @@
-from app import app
+# Inference worker processes are spawned, which re-imports this file as
+# __mp_main__; they load only ml_models and must not build the app
+if __name__ != "__mp_main__":
+    from app import app
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -3,10 +3,14 @@ import pandas as pd
 import pickle
 import os
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
 
+import candidates
+
 # Global variables to hold our models
 heart_model = None
 diabetes_model = None
@@ -16,6 +20,31 @@ pneumonia_model = None
 heart_scaler = StandardScaler()
 diabetes_scaler = StandardScaler()
 
+# Feature order expected by each model
+HEART_FEATURES = [
+    'age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg',
+    'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal'
+]
+DIABETES_FEATURES = [
+    'pregnancies', 'glucose', 'blood_pressure', 'skin_thickness',
+    'insulin', 'bmi', 'diabetes_pedigree', 'age'
+]
+XRAY_FEATURES = [
+    'upper_left_opacity', 'upper_right_opacity', 'lower_left_opacity', 'lower_right_opacity',
+    'mean_intensity', 'contrast', 'dense_fraction'
+]
+
+# Optional out-of-process scoring backend, installed by inference_pool.configure()
+inference_backend = None
+
+# Scores the heart model of a combined screening alongside the request thread
+_screening_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='screening')
+
+# Precomputed explanation structures, rebuilt whenever the models are trained
+heart_node_contributions = None  # (total tree nodes x features), path contribution per node
+heart_tree_offsets = None  # first row of each tree in heart_node_contributions
+heart_baseline = None
+
 def initialize_models():
     """Initialize ML models if they don't exist already"""
     global heart_model, diabetes_model, pneumonia_model
@@ -54,50 +83,182 @@ def initialize_models():
         diabetes_model.fit(X_diabetes_scaled, y_diabetes)
         
         # Pneumonia Model
-        # For this example, we'll use a simple classifier
-        # Normally, for pneumonia detection, you'd use a CNN on chest X-rays
+        # A small CPU-friendly classifier over lung-zone opacity features of
+        # chest X-rays (see xray_features); a CNN would normally be used here
         pneumonia_model = RandomForestClassifier(n_estimators=50, random_state=42)
+        # Train with sample data
+        X_pneumonia = np.array([
+            # upper_left, upper_right, lower_left, lower_right opacity, mean_intensity, contrast, dense_fraction
+            [0.45, 0.47, 0.68, 0.63, 0.52, 0.20, 0.35],  # Positive case
+            [0.32, 0.29, 0.36, 0.35, 0.45, 0.24, 0.07],  # Negative case
+            [0.50, 0.62, 0.55, 0.71, 0.56, 0.18, 0.41],  # Positive case
+            [0.28, 0.30, 0.33, 0.31, 0.42, 0.26, 0.04]   # Negative case
+        ])
+        y_pneumonia = np.array([1, 0, 1, 0])  # 1 = pneumonia, 0 = no pneumonia
+        pneumonia_model.fit(X_pneumonia, y_pneumonia)
+        
+        _build_heart_explainer()
         
         logging.info("ML models initialized successfully")
     except Exception as e:
         logging.error(f"Error initializing ML models: {str(e)}")
         raise
 
-def predict_heart_disease(features):
+def score_probabilities(disease, X):
+    """
+    Scale and score a raw feature matrix with the in-process models.
+    
+    Args:
+        disease (str): 'heart' or 'diabetes'
+        X (np.ndarray): Matrix of shape (n_samples, n_features) in model feature order
+        
+    Returns:
+        np.ndarray: Positive-class probability for each row
+    """
+    if disease == 'heart':
+        return heart_model.predict_proba(heart_scaler.transform(X))[:, 1]
+    if disease == 'diabetes':
+        return diabetes_model.predict_proba(diabetes_scaler.transform(X))[:, 1]
+    raise ValueError(f"Unknown disease model: {disease}")
+
+def _build_heart_explainer():
+    """
+    Precompute per-node contributions for path-based forest explanations.
+    
+    Walking a tree from root to leaf, each split moves the positive-class
+    probability from the parent's value to the child's; that change is
+    credited to the parent's split feature. Accumulating those changes down
+    every path gives, for each node, the contribution vector of the path that
+    ends there, so explaining a sample only needs its leaf in each tree.
+    """
+    global heart_node_contributions, heart_tree_offsets, heart_baseline
+    
+    positive = list(heart_model.classes_).index(1)
+    tables, offsets, baselines = [], [], []
+    offset = 0
+    for estimator in heart_model.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :]
+        probability = value[:, positive] / value.sum(axis=1)
+        internal = tree.children_left != -1
+        
+        # Children always have larger ids than their parent, so fill level by level
+        table = np.zeros((tree.node_count, len(HEART_FEATURES)))
+        frontier = np.array([0])
+        while frontier.size:
+            frontier = frontier[internal[frontier]]
+            features = tree.feature[frontier]
+            for children in (tree.children_left[frontier], tree.children_right[frontier]):
+                table[children] = table[frontier]
+                table[children, features] += probability[children] - probability[frontier]
+            frontier = np.concatenate((tree.children_left[frontier], tree.children_right[frontier]))
+        
+        tables.append(table)
+        offsets.append(offset)
+        baselines.append(probability[0])
+        offset += tree.node_count
+    
+    n_trees = len(heart_model.estimators_)
+    heart_node_contributions = np.vstack(tables) / n_trees
+    heart_tree_offsets = np.array(offsets)
+    heart_baseline = float(np.mean(baselines))
+
+def feature_contributions(disease, X):
+    """
+    Per-feature contributions for a batch of raw feature rows.
+    
+    Heart contributions are in probability units and, with the baseline, sum
+    to the forest's probability. Diabetes contributions are coefficient x
+    standardized value in log-odds units and sum with the intercept to the
+    logit.
+    
+    Args:
+        disease (str): 'heart' or 'diabetes'
+        X (np.ndarray): Matrix of shape (n_samples, n_features) in model feature order
+        
+    Returns:
+        tuple: (baseline, np.ndarray of shape (n_samples, n_features))
+    """
+    if disease == 'heart':
+        # Walk the trees directly: the forest's own apply() pays a joblib
+        # dispatch per call that dwarfs the traversal for small batches
+        X_scaled = np.ascontiguousarray(heart_scaler.transform(X), dtype=np.float32)
+        contributions = np.zeros((X_scaled.shape[0], len(HEART_FEATURES)))
+        for estimator, offset in zip(heart_model.estimators_, heart_tree_offsets):
+            contributions += heart_node_contributions[estimator.tree_.apply(X_scaled) + offset]
+        return heart_baseline, contributions
+    if disease == 'diabetes':
+        standardized = (X - diabetes_scaler.mean_) / diabetes_scaler.scale_
+        contributions = standardized * diabetes_model.coef_[0]
+        return float(diabetes_model.intercept_[0]), contributions
+    raise ValueError(f"Unknown disease model: {disease}")
+
+def _explanation(disease, X, feature_names):
+    """Explanation dict for a single-row X, largest contributions first."""
+    baseline, contributions = feature_contributions(disease, X)
+    items = [
+        {'feature': name, 'value': float(value), 'contribution': round(float(contribution), 4)}
+        for name, value, contribution in zip(feature_names, X[0], contributions[0])
+    ]
+    items.sort(key=lambda item: abs(item['contribution']), reverse=True)
+    return {
+        'units': 'probability' if disease == 'heart' else 'log-odds',
+        'baseline': round(baseline, 4),
+        'contributions': items
+    }
+
+def _predict_probabilities(disease, X, canary=True):
+    """
+    Score X with the primary model, unless a canary candidate takes the request.
+    
+    Args:
+        disease (str): 'heart' or 'diabetes'
+        X (np.ndarray): Raw feature matrix in model feature order
+        canary (bool): Allow a canary candidate to serve this request
+        
+    Returns:
+        tuple: (probabilities, candidate version, or None when the primary model served them)
+    """
+    deployment = candidates.canary(disease) if canary else None
+    if deployment is not None:
+        probabilities = deployment.serve(X)
+        if probabilities is not None:
+            return probabilities, deployment.version
+    
+    started = time.perf_counter()
+    probabilities = _primary_probabilities(disease, X)
+    candidates.shadow(disease, X, probabilities, time.perf_counter() - started)
+    return probabilities, None
+
+def _primary_probabilities(disease, X):
+    """Score X on the configured backend, falling back to in-process scoring."""
+    if inference_backend is not None:
+        try:
+            return inference_backend.predict_proba(disease, X)
+        except Exception as e:
+            logging.warning(f"Inference backend unavailable, scoring in-process: {str(e)}")
+    return score_probabilities(disease, X)
+
+def predict_heart_disease(features, explain=False):
     """
     Predict heart disease based on features.
     
     Args:
         features (dict): Dictionary with feature names and values
+        explain (bool): Include per-feature contributions in the result
         
     Returns:
         dict: Prediction result with probability and information
     """
     try:
         # Extract features in the correct order
-        feature_list = [
-            features.get('age', 0),
-            features.get('sex', 0),
-            features.get('cp', 0),
-            features.get('trestbps', 0),
-            features.get('chol', 0),
-            features.get('fbs', 0),
-            features.get('restecg', 0),
-            features.get('thalach', 0),
-            features.get('exang', 0),
-            features.get('oldpeak', 0),
-            features.get('slope', 0),
-            features.get('ca', 0),
-            features.get('thal', 0)
-        ]
-        
-        # Convert to numpy array and scale
-        X = np.array([feature_list])
-        X_scaled = heart_scaler.transform(X)
+        X = np.array([[features.get(name, 0) for name in HEART_FEATURES]], dtype=float)
         
-        # Get prediction probability
-        prediction = heart_model.predict(X_scaled)[0]
-        probability = heart_model.predict_proba(X_scaled)[0][1]
+        # Get prediction probability; the forest predicts the majority class
+        # Explanations describe the primary model, so explained requests never go to a canary
+        probabilities, model_version = _predict_probabilities('heart', X, canary=not explain)
+        probability = probabilities[0]
+        prediction = probability > 0.5
         
         result = {
             'prediction': bool(prediction),
@@ -122,41 +283,37 @@ def predict_heart_disease(features):
             }
         }
         
+        if model_version is not None:
+            result['model_version'] = model_version
+        
+        if explain:
+            result['explanation'] = _explanation('heart', X, HEART_FEATURES)
+        
         return result
     except Exception as e:
         logging.error(f"Error in heart disease prediction: {str(e)}")
         raise
 
-def predict_diabetes(features):
+def predict_diabetes(features, explain=False):
     """
     Predict diabetes based on features.
     
     Args:
         features (dict): Dictionary with feature names and values
+        explain (bool): Include per-feature contributions in the result
         
     Returns:
         dict: Prediction result with probability and information
     """
     try:
         # Extract features in the correct order
-        feature_list = [
-            features.get('pregnancies', 0),
-            features.get('glucose', 0),
-            features.get('blood_pressure', 0),
-            features.get('skin_thickness', 0),
-            features.get('insulin', 0),
-            features.get('bmi', 0),
-            features.get('diabetes_pedigree', 0),
-            features.get('age', 0)
-        ]
-        
-        # Convert to numpy array and scale
-        X = np.array([feature_list])
-        X_scaled = diabetes_scaler.transform(X)
+        X = np.array([[features.get(name, 0) for name in DIABETES_FEATURES]], dtype=float)
         
-        # Get prediction probability
-        prediction = diabetes_model.predict(X_scaled)[0]
-        probability = diabetes_model.predict_proba(X_scaled)[0][1]
+        # Get prediction probability; logistic regression predicts positive above 0.5
+        # Explanations describe the primary model, so explained requests never go to a canary
+        probabilities, model_version = _predict_probabilities('diabetes', X, canary=not explain)
+        probability = probabilities[0]
+        prediction = probability > 0.5
         
         result = {
             'prediction': bool(prediction),
@@ -182,11 +339,92 @@ def predict_diabetes(features):
             }
         }
         
+        if model_version is not None:
+            result['model_version'] = model_version
+        
+        if explain:
+            result['explanation'] = _explanation('diabetes', X, DIABETES_FEATURES)
+        
         return result
     except Exception as e:
         logging.error(f"Error in diabetes prediction: {str(e)}")
         raise
 
+def _pneumonia_info():
+    """Disease information shown with every pneumonia result."""
+    return {
+        'name': 'Pneumonia',
+        'description': 'Pneumonia is an infection that inflames the air sacs in one or both lungs. The air sacs may fill with fluid or pus, causing cough with phlegm, fever, chills, and difficulty breathing.',
+        'symptoms': [
+            'Chest pain when breathing or coughing', 
+            'Confusion or changes in mental awareness (in adults age 65 and older)',
+            'Cough, which may produce phlegm',
+            'Fatigue',
+            'Fever, sweating and shaking chills',
+            'Lower than normal body temperature (in adults older than age 65 and people with weak immune systems)',
+            'Nausea, vomiting or diarrhea',
+            'Shortness of breath'
+        ],
+        'prevention': [
+            'Get vaccinated',
+            'Ensure children get vaccinated',
+            'Practice good hygiene',
+            'Don\'t smoke',
+            'Keep your immune system strong'
+        ]
+    }
+
+def xray_features(images):
+    """
+    Opacity features for a batch of preprocessed chest X-rays.
+    
+    Pneumonia shows up as consolidation, i.e. brighter regions inside the
+    normally dark lung fields, so the features are mean intensities over
+    fixed upper/lower, left/right lung zones plus global statistics.
+    
+    Args:
+        images (np.ndarray): Array of shape (n, size, size), grayscale in [0, 1]
+        
+    Returns:
+        np.ndarray: Matrix of shape (n, len(XRAY_FEATURES))
+    """
+    size = images.shape[1]
+    upper = slice(int(size * 0.15), int(size * 0.5))
+    lower = slice(int(size * 0.5), int(size * 0.85))
+    left = slice(int(size * 0.15), int(size * 0.45))
+    right = slice(int(size * 0.55), int(size * 0.85))
+    
+    zones = [images[:, rows, cols] for rows in (upper, lower) for cols in (left, right)]
+    lungs = np.concatenate([zone.reshape(len(images), -1) for zone in zones], axis=1)
+    return np.column_stack([
+        *(zone.mean(axis=(1, 2)) for zone in zones),
+        images.mean(axis=(1, 2)),
+        images.std(axis=(1, 2)),
+        (lungs > 0.6).mean(axis=1)
+    ])
+
+def score_xray_images(images):
+    """Positive-class probabilities for a batch of preprocessed chest X-rays."""
+    return pneumonia_model.predict_proba(xray_features(images))[:, 1]
+
+def pneumonia_xray_result(probability):
+    """
+    Build a pneumonia result from an X-ray probability.
+    
+    Args:
+        probability (float): Positive-class probability from score_xray_images
+        
+    Returns:
+        dict: Prediction result with probability and information
+    """
+    return {
+        'prediction': bool(probability > 0.5),
+        'probability': float(probability),
+        'risk_level': 'High' if probability > 0.7 else ('Moderate' if probability > 0.4 else 'Low'),
+        'source': 'xray',
+        'info': _pneumonia_info()
+    }
+
 def predict_pneumonia(features):
     """
     For the example, we'll return a simple result based on a few basic parameters.
@@ -222,30 +460,34 @@ def predict_pneumonia(features):
             'prediction': bool(prediction),
             'probability': float(probability),
             'risk_level': 'High' if probability > 0.7 else ('Moderate' if probability > 0.4 else 'Low'),
-            'info': {
-                'name': 'Pneumonia',
-                'description': 'Pneumonia is an infection that inflames the air sacs in one or both lungs. The air sacs may fill with fluid or pus, causing cough with phlegm, fever, chills, and difficulty breathing.',
-                'symptoms': [
-                    'Chest pain when breathing or coughing', 
-                    'Confusion or changes in mental awareness (in adults age 65 and older)',
-                    'Cough, which may produce phlegm',
-                    'Fatigue',
-                    'Fever, sweating and shaking chills',
-                    'Lower than normal body temperature (in adults older than age 65 and people with weak immune systems)',
-                    'Nausea, vomiting or diarrhea',
-                    'Shortness of breath'
-                ],
-                'prevention': [
-                    'Get vaccinated',
-                    'Ensure children get vaccinated',
-                    'Practice good hygiene',
-                    'Don\'t smoke',
-                    'Keep your immune system strong'
-                ]
-            }
+            'info': _pneumonia_info()
         }
         
         return result
     except Exception as e:
         logging.error(f"Error in pneumonia prediction: {str(e)}")
         raise
+
+def predict_screening(features, explain=False):
+    """
+    Score all three models for one combined screening.
+    
+    The heart forest is the most expensive model, so it is scored on a helper
+    thread while the request thread scores diabetes and pneumonia. With the
+    process inference backend the heart and diabetes model calls run in
+    separate workers.
+    
+    Args:
+        features (dict): Cleaned features per disease, as from validate_screening_form
+        explain (bool): Include per-feature contributions for heart and diabetes
+        
+    Returns:
+        dict: Prediction result per disease
+    """
+    heart = _screening_executor.submit(predict_heart_disease, features['heart'], explain)
+    results = {
+        'diabetes': predict_diabetes(features['diabetes'], explain),
+        'pneumonia': predict_pneumonia(features['pneumonia'])
+    }
+    results['heart'] = heart.result()
+    return results
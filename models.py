@@ -1,10 +1,28 @@
-from app import db, bcrypt, login_manager
+from app import app, db, password_hasher, login_manager
 from datetime import datetime
 from flask_login import UserMixin
+from hashing import HashingBusy
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from user_cache import UserCache
+
+# Column snapshots of recently loaded users, keyed by id
+user_cache = UserCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        # Rebuild the instance and attach it to this request's session without a query
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    user = User.query.get(user_id)
+    if user is not None:
+        user_cache.put(user_id, {column.key: getattr(user, column.key) for column in User.__table__.columns})
+    return user
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,19 +34,118 @@ class User(db.Model, UserMixin):
     predictions = db.relationship('Prediction', backref='user', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
         
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        # Upgrade hashes made with an old cost factor; the caller commits
+        if password_hasher.needs_rehash(self.password_hash):
+            try:
+                self.password_hash = password_hasher.rehash(password)
+            except HashingBusy:
+                pass  # Try again on the next login
+        return True
 
 class Prediction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     prediction_type = db.Column(db.String(50), nullable=False)  # 'heart', 'diabetes', 'pneumonia'
     result = db.Column(db.String(100), nullable=False)
     confidence = db.Column(db.Float, nullable=True)
     input_data = db.Column(db.Text, nullable=False)  # Store JSON of input parameters
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Also the monthly archive partition key
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=True, index=True)
     
     def __repr__(self):
         return f'<Prediction {self.prediction_type}: {self.result}>'
+
+class Patient(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)  # Clinician managing the patient
+    name = db.Column(db.String(120), nullable=False)
+    reference = db.Column(db.String(64), nullable=True)  # External identifier such as a medical record number
+    date_of_birth = db.Column(db.Date, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'reference'),)
+    
+    def __repr__(self):
+        return f'<Patient {self.name}>'
+
+class PatientObservation(db.Model):
+    """
+    Typed feature values and risk from one assessment of a patient.
+    
+    One row per prediction, with a column per model feature (NULL when the
+    assessment did not collect it), so trend and cohort queries read plain
+    columns through the indexes instead of decoding Prediction.input_data.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    prediction_id = db.Column(db.Integer, nullable=True)  # Not a foreign key: retention archives old predictions
+    prediction_type = db.Column(db.String(50), nullable=False)
+    observed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    probability = db.Column(db.Float, nullable=False)
+    positive = db.Column(db.Boolean, nullable=False)
+    # 'xray' for an uploaded chest X-ray, NULL for a form assessment
+    source = db.Column(db.String(20))
+    
+    # Heart disease
+    age = db.Column(db.Integer)
+    sex = db.Column(db.Integer)
+    cp = db.Column(db.Integer)
+    trestbps = db.Column(db.Integer)
+    chol = db.Column(db.Integer)
+    fbs = db.Column(db.Integer)
+    restecg = db.Column(db.Integer)
+    thalach = db.Column(db.Integer)
+    exang = db.Column(db.Integer)
+    oldpeak = db.Column(db.Float)
+    slope = db.Column(db.Integer)
+    ca = db.Column(db.Integer)
+    thal = db.Column(db.Integer)
+    
+    # Diabetes (age is shared with heart disease)
+    pregnancies = db.Column(db.Integer)
+    glucose = db.Column(db.Integer)
+    blood_pressure = db.Column(db.Integer)
+    skin_thickness = db.Column(db.Integer)
+    insulin = db.Column(db.Integer)
+    bmi = db.Column(db.Float)
+    diabetes_pedigree = db.Column(db.Float)
+    
+    # Pneumonia symptoms
+    temperature = db.Column(db.Float)
+    cough_severity = db.Column(db.Integer)
+    breathing_difficulty = db.Column(db.Integer)
+    oxygen_level = db.Column(db.Integer)
+    
+    __table_args__ = (
+        # Per-patient trends: newest first within one patient
+        db.Index('ix_patient_observation_patient_time', 'patient_id', 'observed_at'),
+        # Cohorts: one assessment type over a time window, covering the latest-per-patient ranking
+        db.Index('ix_patient_observation_type_time', 'prediction_type', 'observed_at', 'patient_id'),
+    )
+    
+    def __repr__(self):
+        return f'<PatientObservation {self.prediction_type} for patient {self.patient_id}>'
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    # Flush runs before commit, so a concurrent request can still load and cache
+    # the old row; drop the entry again once the change is committed
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('invalidated_users', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_users(session):
+    for user_id in session.info.pop('invalidated_users', ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_invalidated_users(session):
+    session.info.pop('invalidated_users', None)
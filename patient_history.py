@@ -0,0 +1,270 @@
+"""
+Longitudinal patient history.
+
+Every prediction made for a patient also writes a PatientObservation row
+holding the typed feature values and the predicted probability. Queries
+here read those columns through the (patient_id, observed_at) and
+(prediction_type, observed_at, patient_id) indexes, so a trend never
+decodes the JSON in Prediction.input_data and a cohort touches only the
+rows in its window.
+
+A combined screening records one observation per assessment type with the
+same observed_at, so a feature collected by several types (age) appears on
+more than one row per visit. Queries count each visit once.
+
+Pneumonia is assessed either from symptoms or from a chest X-ray; the
+observation's source tells them apart, and probability trends and cohorts
+never mix the two.
+
+Observations are kept when retention archives the underlying predictions:
+they are the compact long-term record that trends are drawn from.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func
+
+from app import db
+from models import Patient, PatientObservation
+import ml_models
+
+PNEUMONIA_FEATURES = ['temperature', 'cough_severity', 'breathing_difficulty', 'oxygen_level']
+
+# Assessment types that collect each feature
+FEATURE_TYPES = {}
+for _disease, _features in (('heart', ml_models.HEART_FEATURES),
+                            ('diabetes', ml_models.DIABETES_FEATURES),
+                            ('pneumonia', PNEUMONIA_FEATURES)):
+    for _feature in _features:
+        FEATURE_TYPES.setdefault(_feature, []).append(_disease)
+FEATURES = sorted(FEATURE_TYPES)
+
+
+def _column(feature):
+    """Observation column for a feature name, rejecting anything that is not one."""
+    if feature == 'probability':
+        return PatientObservation.probability
+    if feature not in FEATURE_TYPES:
+        raise ValueError(f"Unknown feature '{feature}'")
+    return getattr(PatientObservation, feature)
+
+def _types(feature, prediction_type):
+    if prediction_type is not None:
+        return [prediction_type]
+    if feature == 'probability':
+        raise ValueError("A prediction type is required for probability queries")
+    return FEATURE_TYPES[feature]
+
+def _visits(patient_id, column, types, *criteria):
+    """One (observed_at, value) row per visit of a patient for a feature column."""
+    return db.session.query(PatientObservation.observed_at, func.max(column)).filter(
+        PatientObservation.patient_id == patient_id,
+        PatientObservation.prediction_type.in_(types),
+        column.isnot(None),
+        *criteria
+    ).group_by(PatientObservation.observed_at)
+
+def _source(source):
+    """Filter for observations from one input source."""
+    if source is None:
+        return PatientObservation.source.is_(None)
+    if source != 'xray':
+        raise ValueError(f"Unknown source '{source}'")
+    return PatientObservation.source == source
+
+def record(patient_id, prediction_type, result, features, prediction_id=None, observed_at=None):
+    """
+    Add an observation for a prediction to the session; the caller commits.
+
+    Args:
+        patient_id (int): Patient the prediction was made for
+        prediction_type (str): 'heart', 'diabetes' or 'pneumonia'
+        result (dict): Prediction result with probability and prediction
+        features (dict): Cleaned feature values
+        prediction_id (int): Id of the Prediction row
+        observed_at (datetime): Time of the assessment
+
+    Returns:
+        PatientObservation: The pending observation
+    """
+    observation = PatientObservation(
+        patient_id=patient_id,
+        prediction_id=prediction_id,
+        prediction_type=prediction_type,
+        observed_at=observed_at or datetime.utcnow(),
+        probability=result.get('probability', 0),
+        positive=bool(result.get('prediction')),
+        source=result.get('source'),
+        **{name: value for name, value in features.items() if name in FEATURE_TYPES}
+    )
+    db.session.add(observation)
+    return observation
+
+def latest(patient_id, feature, limit=10, prediction_type=None):
+    """
+    The most recent values of one feature for a patient.
+
+    Args:
+        patient_id (int): Patient to query
+        feature (str): Feature column, or 'probability' with prediction_type
+        limit (int): Number of values
+        prediction_type (str): Restrict to one assessment type
+
+    Returns:
+        list: Dicts with observed_at and value, newest first
+    """
+    column = _column(feature)
+    rows = _visits(patient_id, column, _types(feature, prediction_type)).order_by(
+        PatientObservation.observed_at.desc()
+    ).limit(limit).all()
+    return [{'observed_at': observed_at.isoformat(), 'value': value} for observed_at, value in rows]
+
+def deltas(patient_id, feature, days=90, prediction_type=None):
+    """
+    Visit-to-visit changes of one feature over a trailing window.
+
+    Args:
+        patient_id (int): Patient to query
+        feature (str): Feature column, or 'probability' with prediction_type
+        days (int): Window length ending now
+        prediction_type (str): Restrict to one assessment type
+
+    Returns:
+        dict: Points with per-visit delta, plus the net change and change per day over the window
+    """
+    column = _column(feature)
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = _visits(
+        patient_id, column, _types(feature, prediction_type), PatientObservation.observed_at >= since
+    ).order_by(PatientObservation.observed_at).all()
+
+    points = []
+    previous = None
+    for observed_at, value in rows:
+        points.append({
+            'observed_at': observed_at.isoformat(),
+            'value': value,
+            'delta': None if previous is None else round(value - previous, 4)
+        })
+        previous = value
+
+    change = per_day = None
+    if len(rows) >= 2:
+        change = rows[-1][1] - rows[0][1]
+        span_days = (rows[-1][0] - rows[0][0]).total_seconds() / 86400
+        per_day = change / span_days if span_days > 0 else None
+    return {
+        'feature': feature,
+        'window_days': days,
+        'points': points,
+        'change': None if change is None else round(change, 4),
+        'change_per_day': None if per_day is None else round(per_day, 6)
+    }
+
+def risk_trajectory(patient_id, disease, limit=100, source=None):
+    """
+    Predicted probability over time for one disease, with its trend.
+
+    Args:
+        patient_id (int): Patient to query
+        disease (str): 'heart', 'diabetes' or 'pneumonia'
+        limit (int): Most recent assessments to include
+        source (str): 'xray' for chest X-ray assessments; None for form assessments
+
+    Returns:
+        dict: Points oldest first and the least-squares slope in probability per 30 days
+    """
+    rows = db.session.query(
+        PatientObservation.observed_at, PatientObservation.probability, PatientObservation.positive
+    ).filter(
+        PatientObservation.patient_id == patient_id,
+        PatientObservation.prediction_type == disease,
+        _source(source)
+    ).order_by(PatientObservation.observed_at.desc()).limit(limit).all()
+    rows.reverse()
+
+    slope = None
+    if len(rows) >= 2:
+        days = np.array([(observed_at - rows[0][0]).total_seconds() / 86400 for observed_at, _, _ in rows])
+        if days[-1] > 0:
+            slope = float(np.polyfit(days, [probability for _, probability, _ in rows], 1)[0]) * 30
+    return {
+        'disease': disease,
+        'source': source,
+        'points': [
+            {'observed_at': observed_at.isoformat(), 'probability': probability, 'positive': positive}
+            for observed_at, probability, positive in rows
+        ],
+        'slope_per_30_days': None if slope is None else round(slope, 6)
+    }
+
+def cohort(feature, days=90, min_value=None, max_value=None, prediction_type=None, user_id=None, limit=500):
+    """
+    Patients whose latest value of a feature in a window falls within a range.
+
+    Args:
+        feature (str): Feature column, or 'probability' with prediction_type
+        days (int): Window length ending now
+        min_value (float): Inclusive lower bound
+        max_value (float): Inclusive upper bound
+        prediction_type (str): Restrict to one assessment type
+        user_id (int): Restrict to one clinician's patients; None for all
+        limit (int): Maximum patients returned
+
+    Returns:
+        dict: Matching patients with their latest value, plus summary statistics
+    """
+    column = _column(feature)
+    since = datetime.utcnow() - timedelta(days=days)
+    types = PatientObservation.prediction_type.in_(_types(feature, prediction_type))
+
+    criteria = [types, PatientObservation.observed_at >= since]
+    if feature == 'probability':
+        # Probabilities from X-ray and symptom assessments are not comparable
+        criteria.append(_source(None))
+    else:
+        # Rows without this feature (an X-ray pneumonia assessment has none of
+        # the symptom columns) must not hide an earlier row that has it
+        criteria.append(column.isnot(None))
+
+    # Latest observation per patient within the window holding the feature. The
+    # window is scanned through ix_patient_observation_type_time, reading the
+    # table only to test the column. A screening's rows share observed_at; the
+    # id tiebreak keeps one per visit.
+    ranked = db.session.query(
+        PatientObservation.id,
+        func.row_number().over(
+            partition_by=PatientObservation.patient_id,
+            order_by=(PatientObservation.observed_at.desc(), PatientObservation.id.desc())
+        ).label('rank')
+    ).filter(*criteria).subquery()
+
+    # Then fetch those rows by primary key
+    query = db.session.query(Patient.id, Patient.name, PatientObservation.observed_at, column).select_from(
+        ranked
+    ).join(
+        PatientObservation, PatientObservation.id == ranked.c.id
+    ).join(
+        Patient, Patient.id == PatientObservation.patient_id
+    ).filter(ranked.c.rank == 1)
+    if user_id is not None:
+        query = query.filter(Patient.user_id == user_id)
+    if min_value is not None:
+        query = query.filter(column >= min_value)
+    if max_value is not None:
+        query = query.filter(column <= max_value)
+
+    rows = query.order_by(column.desc()).all()
+    values = np.array([value for _, _, _, value in rows], dtype=float)
+    return {
+        'feature': feature,
+        'window_days': days,
+        'patients': len(rows),
+        'mean': round(float(values.mean()), 4) if len(values) else None,
+        'min': float(values.min()) if len(values) else None,
+        'max': float(values.max()) if len(values) else None,
+        'results': [
+            {'patient_id': patient_id, 'name': name, 'observed_at': observed_at.isoformat(), 'value': value}
+            for patient_id, name, observed_at, value in rows[:limit]
+        ]
+    }
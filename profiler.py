@@ -0,0 +1,265 @@
+"""
+On-demand sampling profiler and slow-request capture.
+
+A single background thread wakes every PROFILER_INTERVAL_MS and reads the
+current stack of each thread that is serving a request via
+sys._current_frames(). Nothing is installed in the profiled code, so a
+request pays only for a dictionary insert at start and end; the sampler's
+own cost is proportional to the number of in-flight requests, not to the
+amount of Python they execute.
+
+Samples feed two consumers:
+
+- A profiling session started by an admin, limited to a time window and
+  optionally to a random fraction of requests. Stacks are aggregated in the
+  collapsed format ("root;caller;callee count") read by flamegraph.pl and
+  speedscope.
+- Slow-request capture, opt-in by setting PROFILER_SLOW_MS to a positive
+  threshold. Every request then keeps its own samples plus SQL statement
+  counts and timings from SQLAlchemy cursor events; requests slower than the
+  threshold are kept in a bounded ring buffer with their stacks, the rest are
+  discarded.
+
+Only the thread serving the request is sampled. Work it hands to other
+threads (the heart model in a combined screening, bcrypt on the hashing
+executor, X-ray decoding and batching) shows up as the request thread
+waiting on a future, not as that work's own stacks.
+
+All state is per process. Under gunicorn each worker has its own sampler,
+session and slow-request buffer, and an admin start, stop or flamegraph call
+reaches whichever worker accepts it; status() reports the pid that answered.
+Profile with a single worker, or repeat the calls until every pid has been
+covered.
+"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOWEST_QUERIES = 5
+TOP_STACKS = 30
+
+_config = {
+    'interval': 0.01,
+    'slow_threshold': 0.0,
+    'max_depth': 64
+}
+_active = {}
+_slow = deque(maxlen=50)
+_profile = Counter()
+_session = {'until': 0.0, 'rate': 1.0, 'started_at': None, 'requests': 0, 'samples': 0}
+_labels = {}
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_sampler = None
+
+
+class _RequestProfile:
+    """Samples and SQL timings for one in-flight request."""
+
+    __slots__ = ('method', 'path', 'started', 'status', 'profiled', 'stacks',
+                 'sql_count', 'sql_seconds', 'queries')
+
+    def __init__(self, method, path, profiled):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.status = None
+        self.profiled = profiled
+        self.stacks = Counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.queries = []
+
+    def add_query(self, statement, seconds):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.queries) < SLOWEST_QUERIES or seconds > self.queries[-1][1]:
+            self.queries.append((statement, seconds))
+            self.queries.sort(key=lambda query: query[1], reverse=True)
+            del self.queries[SLOWEST_QUERIES:]
+
+
+def init_app(app):
+    """
+    Install the request hooks and SQL listeners and start the sampler thread.
+
+    Args:
+        app (Flask): Application to profile
+    """
+    global _slow, _sampler
+    _config['interval'] = app.config.get('PROFILER_INTERVAL_MS', 10) / 1000
+    _config['slow_threshold'] = app.config.get('PROFILER_SLOW_MS', 0) / 1000
+    _slow = deque(maxlen=app.config.get('PROFILER_SLOW_KEEP', 50))
+
+    app.before_request(_begin_request)
+    app.after_request(_record_status)
+    app.teardown_request(_end_request)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if _sampler is None:
+        _sampler = threading.Thread(target=_run_sampler, name='profiler', daemon=True)
+        _sampler.start()
+
+def _session_active():
+    return time.monotonic() < _session['until']
+
+def _begin_request():
+    profiled = _session_active() and random.random() < _session['rate']
+    if not profiled and _config['slow_threshold'] <= 0:
+        return
+    with _lock:
+        _active[threading.get_ident()] = _RequestProfile(request.method, request.path, profiled)
+        if profiled:
+            _session['requests'] += 1
+    _wakeup.set()
+
+def _record_status(response):
+    profile = _active.get(threading.get_ident())
+    if profile is not None:
+        profile.status = response.status_code
+    return response
+
+def _end_request(exc):
+    with _lock:
+        profile = _active.pop(threading.get_ident(), None)
+    if profile is None:
+        return
+
+    duration = time.perf_counter() - profile.started
+    threshold = _config['slow_threshold']
+    if threshold <= 0 or duration < threshold:
+        return
+
+    _slow.append({
+        'method': profile.method,
+        'path': profile.path,
+        'status': profile.status if exc is None else 500,
+        'started_at': datetime.utcnow().isoformat(),
+        'duration_ms': round(duration * 1000, 2),
+        'sql_count': profile.sql_count,
+        'sql_ms': round(profile.sql_seconds * 1000, 2),
+        'slowest_queries': [
+            {'statement': statement[:500], 'ms': round(seconds * 1000, 2)}
+            for statement, seconds in profile.queries
+        ],
+        'samples': sum(profile.stacks.values()),
+        'stacks': profile.stacks.most_common(TOP_STACKS)
+    })
+    logging.warning(f"Slow request {profile.method} {profile.path}: {duration * 1000:.0f} ms, "
+                    f"{profile.sql_count} SQL statements in {profile.sql_seconds * 1000:.0f} ms")
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profiler_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('profiler_query_start')
+    if not starts:
+        return
+    started = starts.pop()
+    profile = _active.get(threading.get_ident())
+    if profile is not None:
+        profile.add_query(statement, time.perf_counter() - started)
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        label = _labels[code] = f"{module}:{code.co_name}"
+    return label
+
+def _collapse(frame):
+    """Collapsed stack of a frame, root first, as used by flame graph tools."""
+    labels = []
+    while frame is not None and len(labels) < _config['max_depth']:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+def _run_sampler():
+    while True:
+        if not _active:
+            # Idle until a request worth sampling begins
+            _wakeup.wait()
+            _wakeup.clear()
+            continue
+
+        time.sleep(_config['interval'])
+        frames = sys._current_frames()
+        with _lock:
+            profiles = list(_active.items())
+        session_active = _session_active()
+        for thread_id, profile in profiles:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = _collapse(frame)
+            profile.stacks[stack] += 1
+            if profile.profiled and session_active:
+                with _lock:
+                    _profile[stack] += 1
+                    _session['samples'] += 1
+        del frames
+
+def start(seconds=30, rate=1.0):
+    """
+    Start a profiling session, discarding the previous one.
+
+    Args:
+        seconds (float): Length of the sampling window
+        rate (float): Fraction of requests to profile, between 0 and 1
+    """
+    with _lock:
+        _profile.clear()
+        _session.update({
+            'until': time.monotonic() + seconds,
+            'rate': min(max(rate, 0.0), 1.0),
+            'started_at': datetime.utcnow().isoformat(),
+            'requests': 0,
+            'samples': 0
+        })
+    logging.info(f"Profiling session started for {seconds}s at rate {rate}")
+
+def stop():
+    """End the current profiling session early; its samples are kept."""
+    with _lock:
+        _session['until'] = 0.0
+
+def collapsed():
+    """The current session's samples as collapsed stacks, one "stack count" per line."""
+    with _lock:
+        stacks = _profile.most_common()
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+def slow_requests():
+    """Captured slow requests, newest first."""
+    return list(reversed(_slow))
+
+def status():
+    with _lock:
+        session = dict(_session)
+        distinct = len(_profile)
+        in_flight = len(_active)
+    remaining = session.pop('until') - time.monotonic()
+    session.update({
+        'active': remaining > 0,
+        'remaining_seconds': round(max(remaining, 0), 1),
+        'distinct_stacks': distinct
+    })
+    return {
+        'pid': os.getpid(),
+        'session': session,
+        'interval_ms': _config['interval'] * 1000,
+        'slow_threshold_ms': _config['slow_threshold'] * 1000,
+        'requests_in_flight': in_flight,
+        'slow_requests_captured': len(_slow)
+    }
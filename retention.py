@@ -0,0 +1,292 @@
+"""
+Prediction retention and archival.
+
+Predictions are partitioned by calendar month of created_at. A background
+job moves every month older than RETENTION_MONTHS out of the live table into
+gzip-compressed JSON-lines archives in instance/archive, which are made
+read-only once complete. Work is done in small id-ordered batches with a
+commit per batch, so the job never holds a write lock for long.
+
+Archive files are named predictions-YYYY-MM-<first id>-<last id>.jsonl.gz.
+The id range records exactly which rows a file contains, which lets an
+interrupted run finish deleting archived rows without archiving them twice.
+
+query_predictions() serves the profile and admin views from the live table
+and, on request, the archives, returning objects with the same attributes.
+Archives are streamed and filtered line by line, and files whose month lies
+outside the requested date range are not opened at all.
+Patient observations (see patient_history) are not archived; they are the
+compact long-term record that patient trends are drawn from.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import stat
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from app import db, mongo
+from models import Prediction
+
+ARCHIVE_PATTERN = re.compile(r'predictions-(\d{4})-(\d{2})-(\d+)-(\d+)\.jsonl\.gz$')
+
+_config = {
+    'directory': None,
+    'months': 12,
+    'batch_size': 500,
+    'interval': 3600,
+    'mongo_ttl_days': None
+}
+
+
+class ArchivedPrediction:
+    """Read-only prediction loaded from an archive file."""
+
+    archived = True
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.user_id = row['user_id']
+        self.prediction_type = row['prediction_type']
+        self.result = row['result']
+        self.confidence = row['confidence']
+        self.input_data = row['input_data']
+        self.created_at = datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+        # Archives written before patients existed have no patient_id
+        self.patient_id = row.get('patient_id')
+
+    def __repr__(self):
+        return f'<ArchivedPrediction {self.prediction_type}: {self.result}>'
+
+
+def init_app(app):
+    """
+    Configure retention from the app and start the background job.
+
+    Args:
+        app (Flask): Application providing config and the instance folder
+    """
+    directory = os.path.join(app.instance_path, 'archive')
+    os.makedirs(directory, exist_ok=True)
+    _config['directory'] = directory
+    _config['months'] = app.config.get('RETENTION_MONTHS', 12)
+    _config['batch_size'] = app.config.get('RETENTION_BATCH_SIZE', 500)
+    _config['interval'] = app.config.get('RETENTION_INTERVAL', 3600)
+    _config['mongo_ttl_days'] = app.config.get('MONGO_TTL_DAYS')
+
+    if app.config.get('RETENTION_ENABLED', True):
+        thread = threading.Thread(target=_run_forever, args=(app,), name='retention', daemon=True)
+        thread.start()
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+def _archive_files(month=None):
+    pattern = f"predictions-{month:%Y-%m}-*.jsonl.gz" if month else "predictions-*.jsonl.gz"
+    files = []
+    for path in glob.glob(os.path.join(_config['directory'], pattern)):
+        match = ARCHIVE_PATTERN.search(os.path.basename(path))
+        if match:
+            year, mon, first_id, last_id = (int(group) for group in match.groups())
+            files.append((datetime(year, mon, 1), first_id, last_id, path))
+    return sorted(files)
+
+def _delete_archived(month_start, month_end, first_id, last_id):
+    """Delete rows of a month that an archive file already holds, batch by batch."""
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(Prediction.id).filter(
+            Prediction.created_at >= month_start,
+            Prediction.created_at < month_end,
+            Prediction.id >= first_id,
+            Prediction.id <= last_id
+        ).order_by(Prediction.id).limit(_config['batch_size'])]
+        if not ids:
+            return deleted
+        Prediction.query.filter(Prediction.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        # Yield the write lock to request threads between batches
+        time.sleep(0.01)
+
+def archive_month(month_start):
+    """
+    Move one month partition from the live table into an archive file.
+
+    Args:
+        month_start (datetime): First instant of the month
+
+    Returns:
+        int: Number of rows archived
+    """
+    month_end = _add_months(month_start, 1)
+
+    # Finish any deletes an earlier, interrupted run left behind
+    for _, first_id, last_id, _ in _archive_files(month_start):
+        _delete_archived(month_start, month_end, first_id, last_id)
+
+    partial_path = os.path.join(_config['directory'], f"predictions-{month_start:%Y-%m}.partial")
+    first_id = last_id = None
+    rows = 0
+    with gzip.open(partial_path, 'wt', encoding='utf-8') as f:
+        while True:
+            query = Prediction.query.filter(
+                Prediction.created_at >= month_start,
+                Prediction.created_at < month_end
+            )
+            if last_id is not None:
+                query = query.filter(Prediction.id > last_id)
+            batch = query.order_by(Prediction.id).limit(_config['batch_size']).all()
+            # End the read so WAL checkpoints are not held back
+            db.session.commit()
+            if not batch:
+                break
+            for prediction in batch:
+                f.write(json.dumps({
+                    'id': prediction.id,
+                    'user_id': prediction.user_id,
+                    'prediction_type': prediction.prediction_type,
+                    'result': prediction.result,
+                    'confidence': prediction.confidence,
+                    'input_data': prediction.input_data,
+                    'created_at': prediction.created_at.isoformat() if prediction.created_at else None,
+                    'patient_id': prediction.patient_id
+                }) + '\n')
+            first_id = batch[0].id if first_id is None else first_id
+            last_id = batch[-1].id
+            rows += len(batch)
+            db.session.expunge_all()
+
+    if not rows:
+        os.remove(partial_path)
+        return 0
+
+    final_path = os.path.join(_config['directory'], f"predictions-{month_start:%Y-%m}-{first_id}-{last_id}.jsonl.gz")
+    os.replace(partial_path, final_path)
+    os.chmod(final_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    _delete_archived(month_start, month_end, first_id, last_id)
+    logging.info(f"Archived {rows} predictions from {month_start:%Y-%m} to {os.path.basename(final_path)}")
+    return rows
+
+def run_once():
+    """Archive every month partition older than the retention window."""
+    cutoff = _add_months(_month_start(datetime.utcnow()), -_config['months'])
+    archived = 0
+    while True:
+        oldest = db.session.query(db.func.min(Prediction.created_at)).filter(
+            Prediction.created_at < cutoff
+        ).scalar()
+        db.session.commit()
+        if oldest is None:
+            return archived
+        archived += archive_month(_month_start(oldest))
+
+def ensure_mongo_ttl():
+    """Expire mirrored predictions in MongoDB after the retention window."""
+    from pymongo.errors import OperationFailure
+
+    ttl_days = _config['mongo_ttl_days'] or _config['months'] * 31
+    ttl_seconds = int(ttl_days * 24 * 3600)
+    try:
+        mongo.db.predictions.create_index('created_at', expireAfterSeconds=ttl_seconds)
+    except OperationFailure:
+        # The index exists with a different TTL; update it in place
+        mongo.db.command('collMod', 'predictions', index={
+            'keyPattern': {'created_at': 1},
+            'expireAfterSeconds': ttl_seconds
+        })
+
+def _try_lock(lock_file):
+    """Take the cross-process archive lock so only one worker archives at a time."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _run_forever(app):
+    lock_path = os.path.join(_config['directory'], '.retention.lock')
+    with app.app_context():
+        try:
+            ensure_mongo_ttl()
+        except Exception as e:
+            logging.error(f"Error enforcing MongoDB TTL: {str(e)}")
+
+        while True:
+            try:
+                with open(lock_path, 'w') as lock_file:
+                    if _try_lock(lock_file):
+                        run_once()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error archiving predictions: {str(e)}")
+            finally:
+                db.session.remove()
+            time.sleep(_config['interval'])
+
+def _read_archive(path, user_id=None, since=None, until=None):
+    """Stream the rows of one archive file that match the filters."""
+    # Rows are written by json.dumps with default separators, so a user's rows
+    # contain this text and the rest can be skipped without parsing
+    needle = f'"user_id": {user_id},' if user_id is not None else None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if needle is not None and needle not in line:
+                continue
+            row = json.loads(line)
+            if user_id is not None and row['user_id'] != user_id:
+                continue
+            prediction = ArchivedPrediction(row)
+            if since is not None and (prediction.created_at is None or prediction.created_at < since):
+                continue
+            if until is not None and (prediction.created_at is None or prediction.created_at >= until):
+                continue
+            yield prediction
+
+def query_predictions(user_id=None, include_archived=False, since=None, until=None):
+    """
+    Predictions newest first, optionally including archived partitions.
+
+    Args:
+        user_id (int): Restrict to one user's predictions
+        include_archived (bool): Also read the read-only archive files
+        since (datetime): Only predictions created at or after this time
+        until (datetime): Only predictions created before this time
+
+    Returns:
+        list: Prediction and ArchivedPrediction objects
+    """
+    query = Prediction.query
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    if since is not None:
+        query = query.filter(Prediction.created_at >= since)
+    if until is not None:
+        query = query.filter(Prediction.created_at < until)
+    predictions = query.order_by(Prediction.created_at.desc()).all()
+
+    if include_archived and _config['directory'] is not None:
+        for month, _, _, path in reversed(_archive_files()):
+            # Each file holds one calendar month, named in the file
+            if since is not None and _add_months(month, 1) <= since:
+                continue
+            if until is not None and month >= until:
+                continue
+            rows = list(_read_archive(path, user_id, since, until))
+            predictions.extend(sorted(rows, key=lambda row: row.created_at or datetime.min, reverse=True))
+    return predictions
@@ -1,35 +1,72 @@
-from flask import render_template, request, redirect, url_for, flash, session, jsonify
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, abort
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_login import login_user, current_user, logout_user, login_required
-from app import app, db
+from app import app, db, password_hasher
 import ml_models
+import inference_pool
+import http_cache
+import drift
+import retention
+import xray
+import admission
+import profiler
+import candidates
+import patient_history
 from utils import (
     save_prediction, 
+    save_predictions,
     validate_heart_disease_form, 
     validate_diabetes_form,
-    validate_pneumonia_form
+    validate_pneumonia_form,
+    validate_screening_form,
+    json_form_values
 )
-from forms import RegistrationForm, LoginForm
-from models import User, Prediction
+from forms import RegistrationForm, LoginForm, PatientForm
+from hashing import HashingBusy
+from models import User, Prediction, Patient, user_cache
 import logging
 import json
 
 # Initialize ML models - will be called from app.py
 def initialize():
     ml_models.initialize_models()
+    inference_pool.configure(app.config)
+    candidates.init_app(app, {'heart': ml_models.heart_scaler, 'diabetes': ml_models.diabetes_scaler})
 
 @app.route('/')
+@http_cache.cached_page
 def index():
     return render_template('index.html')
 
 @app.route('/about')
+@http_cache.cached_page
 def about():
     return render_template('about.html')
     
 @app.route('/data-flow')
+@http_cache.cached_page
 def data_flow():
     return render_template('data_flow.html')
 
+@app.context_processor
+def inject_patient_options():
+    def user_patients():
+        # Called only by forms that offer a patient selector
+        if not current_user.is_authenticated:
+            return []
+        return Patient.query.filter_by(user_id=current_user.id).order_by(Patient.name).all()
+    return {'user_patients': user_patients}
+
+def _selected_patient_id():
+    """Patient chosen on a prediction form, if it belongs to the current user."""
+    patient_id = request.form.get('patient_id', type=int)
+    if not patient_id or not current_user.is_authenticated:
+        return None
+    patient = Patient.query.filter_by(id=patient_id, user_id=current_user.id).first()
+    return patient.id if patient else None
+
 @app.route('/heart-disease', methods=['GET', 'POST'])
+@admission.limit()
 def heart_disease():
     if request.method == 'POST':
         try:
@@ -42,11 +79,12 @@ def heart_disease():
                 return render_template('heart_disease.html', form_data=request.form, errors=errors)
             
             # Make prediction
-            result = ml_models.predict_heart_disease(cleaned_data)
+            result = ml_models.predict_heart_disease(cleaned_data, explain=request.form.get('explain') == '1')
+            drift.observe('heart', cleaned_data, result['prediction'])
             
             # Save prediction to session and database
             user_id = current_user.id if current_user.is_authenticated else None
-            prediction_id = save_prediction('heart', result, cleaned_data, user_id)
+            prediction_id = save_prediction('heart', result, cleaned_data, user_id, patient_id=_selected_patient_id())
             session['prediction_result'] = {
                 'id': prediction_id,
                 'type': 'heart',
@@ -64,6 +102,7 @@ def heart_disease():
     return render_template('heart_disease.html', form_data={}, errors={})
 
 @app.route('/diabetes', methods=['GET', 'POST'])
+@admission.limit()
 def diabetes():
     if request.method == 'POST':
         try:
@@ -76,11 +115,12 @@ def diabetes():
                 return render_template('diabetes.html', form_data=request.form, errors=errors)
             
             # Make prediction
-            result = ml_models.predict_diabetes(cleaned_data)
+            result = ml_models.predict_diabetes(cleaned_data, explain=request.form.get('explain') == '1')
+            drift.observe('diabetes', cleaned_data, result['prediction'])
             
             # Save prediction to session and database
             user_id = current_user.id if current_user.is_authenticated else None
-            prediction_id = save_prediction('diabetes', result, cleaned_data, user_id)
+            prediction_id = save_prediction('diabetes', result, cleaned_data, user_id, patient_id=_selected_patient_id())
             session['prediction_result'] = {
                 'id': prediction_id,
                 'type': 'diabetes',
@@ -98,23 +138,32 @@ def diabetes():
     return render_template('diabetes.html', form_data={}, errors={})
 
 @app.route('/pneumonia', methods=['GET', 'POST'])
+@admission.limit()
 def pneumonia():
     if request.method == 'POST':
         try:
-            # Validate form data
-            is_valid, errors, cleaned_data = validate_pneumonia_form(request.form)
-            
-            if not is_valid:
-                for field, error in errors.items():
-                    flash(error, 'danger')
-                return render_template('pneumonia.html', form_data=request.form, errors=errors)
-            
-            # Make prediction
-            result = ml_models.predict_pneumonia(cleaned_data)
+            xray_file = request.files.get('xray')
+            if xray_file and xray_file.filename:
+                # Chest X-ray upload: score the image instead of the symptom form
+                result, digest = xray.predict(xray_file.read())
+                cleaned_data = {'xray_sha256': digest}
+            else:
+                # Validate form data
+                is_valid, errors, cleaned_data = validate_pneumonia_form(request.form)
+                
+                if not is_valid:
+                    for field, error in errors.items():
+                        flash(error, 'danger')
+                    return render_template('pneumonia.html', form_data=request.form, errors=errors,
+                                           xray_available=xray.available())
+                
+                # Make prediction
+                result = ml_models.predict_pneumonia(cleaned_data)
+            drift.observe('pneumonia', cleaned_data, result['prediction'])
             
             # Save prediction to session and database
             user_id = current_user.id if current_user.is_authenticated else None
-            prediction_id = save_prediction('pneumonia', result, cleaned_data, user_id)
+            prediction_id = save_prediction('pneumonia', result, cleaned_data, user_id, patient_id=_selected_patient_id())
             session['prediction_result'] = {
                 'id': prediction_id,
                 'type': 'pneumonia',
@@ -124,12 +173,80 @@ def pneumonia():
             # Redirect to results page
             return redirect(url_for('results'))
             
+        except xray.XrayError as e:
+            flash(str(e), 'danger')
+            return render_template('pneumonia.html', form_data={}, errors={}, xray_available=xray.available())
+        except RequestEntityTooLarge:
+            # The body is refused by MAX_CONTENT_LENGTH before it is buffered
+            flash('The uploaded image is too large.', 'danger')
+            return render_template('pneumonia.html', form_data={}, errors={}, xray_available=xray.available()), 413
         except Exception as e:
             logging.error(f"Error in pneumonia prediction: {str(e)}")
             flash(f"An error occurred: {str(e)}", 'danger')
-            return render_template('pneumonia.html', form_data={}, errors={})
+            return render_template('pneumonia.html', form_data={}, errors={}, xray_available=xray.available())
+    
+    return render_template('pneumonia.html', form_data={}, errors={}, xray_available=xray.available())
+
+def _run_screening(cleaned_data, explain):
+    """Score, monitor and persist one combined screening."""
+    results = ml_models.predict_screening(cleaned_data, explain=explain)
+    for disease, result in results.items():
+        drift.observe(disease, cleaned_data[disease], result['prediction'])
+    
+    user_id = current_user.id if current_user.is_authenticated else None
+    diseases = list(results)
+    ids = save_predictions([(disease, results[disease], cleaned_data[disease]) for disease in diseases], user_id,
+                           patient_id=_selected_patient_id())
+    return results, dict(zip(diseases, ids))
+
+@app.route('/screening', methods=['GET', 'POST'])
+@admission.limit()
+def screening():
+    if request.method == 'POST':
+        try:
+            # Validate the union of all three forms in one pass
+            is_valid, errors, cleaned_data = validate_screening_form(request.form)
+            
+            if not is_valid:
+                for field, error in errors.items():
+                    flash(error, 'danger')
+                return render_template('screening.html', form_data=request.form, errors=errors)
+            
+            results, prediction_ids = _run_screening(cleaned_data, request.form.get('explain') == '1')
+            session['prediction_result'] = {
+                'ids': prediction_ids,
+                'type': 'screening',
+                'results': results
+            }
+            
+            # Redirect to results page
+            return redirect(url_for('results'))
+            
+        except Exception as e:
+            logging.error(f"Error in combined screening: {str(e)}")
+            flash(f"An error occurred: {str(e)}", 'danger')
+            return render_template('screening.html', form_data={}, errors={})
+    
+    return render_template('screening.html', form_data={}, errors={})
+
+@app.route('/api/screening', methods=['POST'])
+@admission.limit()
+def api_screening():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object of screening fields'}), 400
     
-    return render_template('pneumonia.html', form_data={}, errors={})
+    try:
+        # The validators expect form-style string values
+        is_valid, errors, cleaned_data = validate_screening_form(json_form_values(payload))
+        if not is_valid:
+            return jsonify({'error': 'Validation failed', 'errors': errors}), 400
+        
+        results, prediction_ids = _run_screening(cleaned_data, bool(payload.get('explain')))
+        return jsonify({'prediction_ids': prediction_ids, 'results': results})
+    except Exception as e:
+        logging.error(f"Error in screening API: {str(e)}")
+        return jsonify({'error': 'Screening failed'}), 500
 
 @app.route('/results')
 def results():
@@ -140,6 +257,9 @@ def results():
         flash('No prediction results found. Please make a prediction first.', 'warning')
         return redirect(url_for('index'))
     
+    if prediction_result['type'] == 'screening':
+        return render_template('screening_results.html', results=prediction_result['results'],
+                               prediction_ids=prediction_result['ids'])
     return render_template('results.html', prediction=prediction_result)
 
 @app.errorhandler(404)
@@ -158,7 +278,15 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            password_ok = user is not None and user.check_password(form.password.data)
+        except HashingBusy as e:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('login.html', form=form), 503, {'Retry-After': str(e.retry_after)}
+        
+        if password_ok:
+            # Persist a rehashed password, if check_password upgraded it
+            db.session.commit()
             login_user(user, remember=form.remember.data)
             flash('Login successful!', 'success')
             next_page = request.args.get('next')
@@ -179,13 +307,16 @@ def register():
             username=form.username.data,
             email=form.email.data
         )
-        user.set_password(form.password.data)
         
         try:
+            user.set_password(form.password.data)
             db.session.add(user)
             db.session.commit()
             flash('Your account has been created! You can now log in.', 'success')
             return redirect(url_for('login'))
+        except HashingBusy as e:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('register.html', form=form), 503, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error creating user: {str(e)}")
@@ -199,12 +330,20 @@ def logout():
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('index'))
 
+def _since_days():
+    """Start of the ?days=N range, or None for all history."""
+    from datetime import datetime, timedelta
+    days = request.args.get('days', type=int)
+    return datetime.utcnow() - timedelta(days=days) if days else None
+
 @app.route('/profile')
 @login_required
 def profile():
-    # Get user's predictions
-    predictions = Prediction.query.filter_by(user_id=current_user.id).order_by(Prediction.created_at.desc()).all()
-    return render_template('profile.html', predictions=predictions)
+    # Get user's predictions, including archived months on request; ?days=N limits the range
+    include_archived = request.args.get('archived') == '1'
+    predictions = retention.query_predictions(user_id=current_user.id, include_archived=include_archived,
+                                              since=_since_days())
+    return render_template('profile.html', predictions=predictions, include_archived=include_archived)
 
 @app.route('/admin')
 @login_required
@@ -215,10 +354,222 @@ def admin():
     
     # Get all users and predictions for admin panel
     users = User.query.all()
-    predictions = Prediction.query.order_by(Prediction.created_at.desc()).all()
+    include_archived = request.args.get('archived') == '1'
+    predictions = retention.query_predictions(include_archived=include_archived, since=_since_days())
     
     # Calculate timestamp for 24 hours ago for recent predictions
     from datetime import datetime, timedelta
     now_minus_24h = datetime.utcnow() - timedelta(days=1)
     
-    return render_template('admin.html', users=users, predictions=predictions, now_minus_24h=now_minus_24h)
+    return render_template('admin.html', users=users, predictions=predictions, now_minus_24h=now_minus_24h,
+                           include_archived=include_archived)
+
+@app.route('/admin/inference-health')
+@login_required
+def inference_health():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    return jsonify(inference_pool.health())
+
+@app.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    return jsonify({
+        'user_cache': user_cache.stats(),
+        'password_hashing': password_hasher.stats(),
+        'http_cache': http_cache.stats(),
+        'xray': xray.stats(),
+        'admission': admission.stats()
+    })
+
+@app.route('/admin/drift')
+@login_required
+def admin_drift():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    return jsonify(drift.report())
+
+@app.route('/admin/profiler')
+@login_required
+def admin_profiler():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    return jsonify(profiler.status())
+
+@app.route('/admin/profiler/start', methods=['POST'])
+@login_required
+def admin_profiler_start():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    try:
+        seconds = float(request.values.get('seconds', 30))
+        rate = float(request.values.get('rate', 1.0))
+    except ValueError:
+        return jsonify({'error': 'seconds and rate must be numbers'}), 400
+    
+    # Cap the window so a forgotten session does not run indefinitely
+    profiler.start(seconds=min(max(seconds, 1), 600), rate=rate)
+    return jsonify(profiler.status())
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+@login_required
+def admin_profiler_stop():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    profiler.stop()
+    return jsonify(profiler.status())
+
+@app.route('/admin/profiler/flamegraph')
+@login_required
+def admin_profiler_flamegraph():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    # Collapsed stacks for flamegraph.pl or speedscope
+    return profiler.collapsed(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.route('/admin/profiler/slow')
+@login_required
+def admin_profiler_slow():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    return jsonify(profiler.slow_requests())
+
+@app.route('/admin/candidates')
+@login_required
+def admin_candidates():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    return jsonify(candidates.stats())
+
+@app.route('/admin/candidates/<disease>', methods=['POST'])
+@login_required
+def admin_candidate_mode(disease):
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    try:
+        candidates.set_mode(disease, request.values.get('mode', ''))
+    except KeyError:
+        return jsonify({'error': f"No candidate model is loaded for {disease}"}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(candidates.stats())
+
+def _patient_or_404(patient_id):
+    """A patient of the current user; admins may view any patient."""
+    patient = Patient.query.get_or_404(patient_id)
+    if patient.user_id != current_user.id and not current_user.is_admin:
+        abort(404)
+    return patient
+
+@app.route('/patients', methods=['GET', 'POST'])
+@login_required
+def patients():
+    form = PatientForm()
+    if form.validate_on_submit():
+        try:
+            patient = Patient(
+                user_id=current_user.id,
+                name=form.name.data,
+                reference=form.reference.data or None,
+                date_of_birth=form.date_of_birth.data
+            )
+            db.session.add(patient)
+            db.session.commit()
+            flash(f'Patient {patient.name} added.', 'success')
+            return redirect(url_for('patient_detail', patient_id=patient.id))
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error creating patient: {str(e)}")
+            flash('Could not add the patient. Record numbers must be unique.', 'danger')
+    
+    patient_list = Patient.query.filter_by(user_id=current_user.id).order_by(Patient.name).all()
+    return render_template('patients.html', form=form, patients=patient_list)
+
+@app.route('/patients/<int:patient_id>')
+@login_required
+def patient_detail(patient_id):
+    patient = _patient_or_404(patient_id)
+    feature = request.args.get('feature', 'glucose')
+    days = request.args.get('days', 365, type=int)
+    try:
+        trend = patient_history.deltas(patient.id, feature, days=days)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        feature = 'glucose'
+        trend = patient_history.deltas(patient.id, feature, days=days)
+    
+    trajectories = {
+        disease: patient_history.risk_trajectory(patient.id, disease, limit=20)
+        for disease in ('heart', 'diabetes', 'pneumonia')
+    }
+    return render_template('patient_detail.html', patient=patient, trend=trend, trajectories=trajectories,
+                           features=patient_history.FEATURES, feature=feature, days=days)
+
+@app.route('/api/patients/<int:patient_id>/trend')
+@login_required
+def api_patient_trend(patient_id):
+    patient = _patient_or_404(patient_id)
+    feature = request.args.get('feature', '')
+    prediction_type = request.args.get('type')
+    try:
+        return jsonify({
+            'patient_id': patient.id,
+            'latest': patient_history.latest(patient.id, feature, limit=request.args.get('limit', 10, type=int),
+                                             prediction_type=prediction_type),
+            'window': patient_history.deltas(patient.id, feature, days=request.args.get('days', 90, type=int),
+                                             prediction_type=prediction_type)
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/patients/<int:patient_id>/risk')
+@login_required
+def api_patient_risk(patient_id):
+    patient = _patient_or_404(patient_id)
+    disease = request.args.get('disease', 'heart')
+    if disease not in ('heart', 'diabetes', 'pneumonia'):
+        return jsonify({'error': 'disease must be heart, diabetes or pneumonia'}), 400
+    source = request.args.get('source')
+    if source not in (None, 'xray'):
+        return jsonify({'error': "source must be 'xray' or omitted for form assessments"}), 400
+    return jsonify(patient_history.risk_trajectory(patient.id, disease, limit=request.args.get('limit', 100, type=int),
+                                                   source=source))
+
+@app.route('/api/cohort')
+@login_required
+def api_cohort():
+    try:
+        return jsonify(patient_history.cohort(
+            request.args.get('feature', ''),
+            days=request.args.get('days', 90, type=int),
+            min_value=request.args.get('min', type=float),
+            max_value=request.args.get('max', type=float),
+            prediction_type=request.args.get('type'),
+            # Clinicians see their own patients; admins see every patient
+            user_id=None if current_user.is_admin else current_user.id,
+            limit=request.args.get('limit', 500, type=int)
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
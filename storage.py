@@ -0,0 +1,132 @@
+"""
+Database storage profiles.
+
+SQLite defaults to a rollback journal, so every commit takes an exclusive
+lock on the whole file and concurrent writers fail with "database is locked".
+The production profile switches SQLite to WAL with a busy timeout and tuned
+per-connection pragmas, and sizes the connection pool differently for SQLite
+and for a server database configured through DATABASE_URL.
+"""
+import logging
+import os
+import sqlite3
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.pool import StaticPool
+
+
+def database_uri(default_path):
+    """
+    Resolve the database URI from DATABASE_URL, falling back to a SQLite file.
+
+    Args:
+        default_path (str): Path of the SQLite file used when DATABASE_URL is unset
+
+    Returns:
+        str: SQLAlchemy database URI
+    """
+    uri = os.environ.get('DATABASE_URL')
+    if not uri:
+        return f"sqlite:///{default_path}"
+    # Some hosting providers still hand out the deprecated postgres:// scheme
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+def sqlite_pragmas():
+    """Per-connection SQLite pragmas for the production profile."""
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        # Negative values are KiB, so this is a 20 MB page cache per connection
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-20000')),
+        'temp_store': 'MEMORY',
+    }
+
+def engine_options(uri):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS suited to the database behind uri.
+
+    Args:
+        uri (str): SQLAlchemy database URI
+
+    Returns:
+        dict: Keyword arguments for create_engine
+    """
+    if uri.startswith('sqlite'):
+        busy_timeout = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        connect_args = {'timeout': busy_timeout / 1000, 'check_same_thread': False}
+        if uri in ('sqlite://', 'sqlite:///:memory:'):
+            # An in-memory database only exists inside its one connection
+            return {'connect_args': connect_args, 'poolclass': StaticPool}
+        # Connections are cheap and local, so keep enough for every web thread
+        # but no overflow: extra connections would only queue on the write lock
+        return {
+            'connect_args': connect_args,
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+            'max_overflow': 0,
+            'pool_timeout': 30,
+        }
+
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': 30,
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    }
+
+def apply_sqlite_profile(engine, pragmas=None):
+    """
+    Run the production pragmas on every new connection made by engine.
+
+    Does nothing for non-SQLite engines.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = pragmas or sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    logging.info(f"SQLite profile applied: {pragmas}")
+
+def add_missing_columns(engine, metadata):
+    """
+    Add columns declared on models to tables that were created before them.
+
+    create_all never alters an existing table. Only nullable columns can be
+    added this way; anything else is logged and needs a manual migration.
+
+    Args:
+        engine (Engine): Database to update
+        metadata (MetaData): Declared tables
+    """
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable:
+                    logging.error(f"Cannot add NOT NULL column {table.name}.{column.name} to an existing table")
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+                logging.info(f"Added column {table.name}.{column.name}")
@@ -2,8 +2,9 @@ import json
 from datetime import datetime
 from models import Prediction
 from app import db
+import patient_history
 
-def save_prediction(prediction_type, result, input_data, user_id=None):
+def save_prediction(prediction_type, result, input_data, user_id=None, patient_id=None):
     try:
         # Convert dictionaries to JSON strings for SQLite
         result_str = json.dumps(result)
@@ -16,17 +17,24 @@ def save_prediction(prediction_type, result, input_data, user_id=None):
             result=result_str,
             confidence=result.get('probability', 0),
             input_data=input_str,
-            created_at=datetime.utcnow()
+            created_at=datetime.utcnow(),
+            patient_id=patient_id
         )
         
         # Save to SQLite database
         db.session.add(prediction)
+        if patient_id is not None:
+            # Typed copy of the inputs for trend queries, in the same transaction
+            db.session.flush()
+            patient_history.record(patient_id, prediction_type, result, input_data,
+                                   prediction_id=prediction.id, observed_at=prediction.created_at)
         db.session.commit()
         
         # Also save to MongoDB - need to import mongo from app
         from app import mongo
         mongo.db.predictions.insert_one({
             'user_id': user_id,
+            'patient_id': patient_id,
             'prediction_type': prediction_type,
             'result': result,  # Can use dict directly in MongoDB
             'confidence': result.get('probability', 0),
@@ -39,6 +47,60 @@ def save_prediction(prediction_type, result, input_data, user_id=None):
         db.session.rollback()
         raise e
 
+def save_predictions(entries, user_id=None, patient_id=None):
+    """
+    Save several predictions with one SQLite transaction and one MongoDB insert.
+    
+    Args:
+        entries (list): (prediction_type, result, input_data) tuples
+        user_id (int): Owner of the predictions
+        patient_id (int): Patient the predictions were made for
+        
+    Returns:
+        list: SQLite ids in the order of entries
+    """
+    try:
+        created_at = datetime.utcnow()
+        predictions = [
+            Prediction(
+                user_id=user_id,
+                prediction_type=prediction_type,
+                result=json.dumps(result),
+                confidence=result.get('probability', 0),
+                input_data=json.dumps(input_data),
+                created_at=created_at,
+                patient_id=patient_id
+            )
+            for prediction_type, result, input_data in entries
+        ]
+        
+        db.session.add_all(predictions)
+        if patient_id is not None:
+            db.session.flush()
+            for prediction, (prediction_type, result, input_data) in zip(predictions, entries):
+                patient_history.record(patient_id, prediction_type, result, input_data,
+                                       prediction_id=prediction.id, observed_at=created_at)
+        db.session.commit()
+        
+        from app import mongo
+        mongo.db.predictions.insert_many([
+            {
+                'user_id': user_id,
+                'patient_id': patient_id,
+                'prediction_type': prediction_type,
+                'result': result,
+                'confidence': result.get('probability', 0),
+                'parameters': input_data,
+                'created_at': created_at
+            }
+            for prediction_type, result, input_data in entries
+        ], ordered=False)
+        
+        return [prediction.id for prediction in predictions]
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
 def validate_heart_disease_form(form_data):
     """
     Validate heart disease form data
@@ -361,3 +423,50 @@ def validate_pneumonia_form(form_data):
     
     is_valid = len(errors) == 0
     return is_valid, errors, cleaned_data
+
+def validate_screening_form(form_data):
+    """
+    Validate a combined screening form against the union of all three schemas
+    
+    Fields shared between models (age) appear once in the form and feed every
+    model that uses them.
+    
+    Args:
+        form_data (dict): Form data from request
+        
+    Returns:
+        tuple: (is_valid, errors, cleaned_data) with cleaned_data keyed by disease
+    """
+    errors = {}
+    cleaned_data = {}
+    for disease, validate in (('heart', validate_heart_disease_form),
+                              ('diabetes', validate_diabetes_form),
+                              ('pneumonia', validate_pneumonia_form)):
+        _, disease_errors, cleaned_data[disease] = validate(form_data)
+        # Identical rules produce identical messages for shared fields
+        errors.update(disease_errors)
+    
+    is_valid = len(errors) == 0
+    return is_valid, errors, cleaned_data
+
+def json_form_values(payload):
+    """
+    Convert JSON values to the strings a submitted form would contain
+    
+    JSON clients send numbers and booleans, so whole floats such as 63.0 become
+    "63" and true/false become "1"/"0" before the integer fields are parsed.
+    
+    Args:
+        payload (dict): Decoded JSON object
+        
+    Returns:
+        dict: Form-style string values
+    """
+    values = {}
+    for key, value in payload.items():
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        values[key] = str(value)
+    return values
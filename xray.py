@@ -0,0 +1,298 @@
+"""
+CPU-only chest X-ray inference pipeline for pneumonia.
+
+Uploads go through three stages:
+
+1. Decode: Pillow decodes on a small thread pool (it releases the GIL). For
+   JPEGs, draft mode lets the decoder scale down in the DCT domain, so a
+   large radiograph is never fully materialised before the resize.
+2. Cache: the preprocessed tensor is keyed by the SHA-256 of the upload and
+   stored as a memory-mapped .npy file in instance/xray, so resubmitting the
+   same image skips decoding entirely. The store is capped at
+   XRAY_CACHE_MAX_MB; least recently used files are removed first.
+3. Batch: a single scorer thread collects tensors for up to
+   XRAY_BATCH_WAIT_MS (or XRAY_BATCH_SIZE items) and scores them with one
+   model call, amortising per-call overhead under concurrent uploads.
+
+Uploads larger than XRAY_MAX_PIXELS after draft scaling are rejected before
+the full bitmap is decoded.
+
+Pillow is a declared dependency; if it is missing anyway the upload path
+reports itself unavailable.
+"""
+import hashlib
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+import ml_models
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+_config = {
+    'directory': None,
+    'size': 128,
+    'batch_size': 16,
+    'batch_wait': 0.005,
+    'max_bytes': 10 * 1024 * 1024,
+    'max_pixels': 25000000,
+    'cache_max_bytes': 256 * 1024 * 1024,
+    'timeout': 30
+}
+_decoder = None
+_batcher = None
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+RECENT_TENSORS = 256
+# Writes between rescans of the tensor store, so files written by other
+# worker processes count towards the cap
+RESCAN_EVERY = 256
+# Pruning removes files until the store is this fraction of its cap
+PRUNE_TO = 0.9
+_store = {'bytes': 0, 'writes': 0, 'pruning': False, 'pruned': 0}
+_store_lock = threading.Lock()
+
+
+class XrayError(ValueError):
+    """Raised for uploads that cannot be used, with a user-facing message."""
+
+
+def available():
+    return Image is not None and _batcher is not None
+
+def init_app(app):
+    """Configure the pipeline from the app and start its worker threads."""
+    global _decoder, _batcher
+    if Image is None:
+        logging.warning("Pillow is not installed; chest X-ray uploads are disabled")
+        return
+
+    directory = os.path.join(app.instance_path, 'xray')
+    os.makedirs(directory, exist_ok=True)
+    _config['directory'] = directory
+    _config['size'] = app.config.get('XRAY_IMAGE_SIZE', 128)
+    _config['batch_size'] = app.config.get('XRAY_BATCH_SIZE', 16)
+    _config['batch_wait'] = app.config.get('XRAY_BATCH_WAIT_MS', 5) / 1000
+    _config['max_bytes'] = app.config.get('XRAY_MAX_BYTES', 10 * 1024 * 1024)
+    _config['max_pixels'] = app.config.get('XRAY_MAX_PIXELS', 25000000)
+    _config['cache_max_bytes'] = app.config.get('XRAY_CACHE_MAX_MB', 256) * 1024 * 1024
+
+    _decoder = ThreadPoolExecutor(max_workers=app.config.get('XRAY_DECODE_WORKERS', 2), thread_name_prefix='xray-decode')
+    _batcher = _Batcher(ml_models.score_xray_images, _config['batch_size'], _config['batch_wait'])
+    # Measure what earlier runs left behind
+    with _store_lock:
+        _store['pruning'] = True
+    _decoder.submit(_prune)
+
+def preprocess(data, size=None):
+    """
+    Decode image bytes into a normalised square grayscale tensor.
+
+    Args:
+        data (bytes): Encoded image (JPEG, PNG, ...)
+        size (int): Output side length in pixels
+
+    Returns:
+        np.ndarray: float32 array of shape (size, size) with values in [0, 1]
+    """
+    size = size or _config['size']
+    try:
+        # Only the header is read here; pixels are decoded by convert()
+        image = Image.open(io.BytesIO(data))
+        # JPEG: decode straight to grayscale at the smallest scale >= 2x the target
+        image.draft('L', (size * 2, size * 2))
+    except Exception as e:
+        raise XrayError(f"Could not read the uploaded image: {str(e)}")
+
+    # Draft mode cannot shrink PNGs and other formats, so bound the bitmap first
+    width, height = image.size
+    if width * height > _config['max_pixels']:
+        raise XrayError(f"X-ray images must be at most {_config['max_pixels'] // 1000000} megapixels")
+
+    try:
+        image = image.convert('L').resize((size, size), Image.BILINEAR)
+    except Exception as e:
+        raise XrayError(f"Could not read the uploaded image: {str(e)}")
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+def _tensor_path(digest):
+    return os.path.join(_config['directory'], digest[:2], f"{digest}-{_config['size']}.npy")
+
+def load_tensor(data):
+    """
+    Return the preprocessed tensor for an upload, decoding only on a cache miss.
+
+    Returns:
+        tuple: (sha256 hex digest, memory-mapped float32 tensor)
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    with _recent_lock:
+        tensor = _recent.get(digest)
+        if tensor is not None:
+            _recent.move_to_end(digest)
+            return digest, tensor
+
+    path = _tensor_path(digest)
+    if os.path.exists(path):
+        tensor = np.load(path, mmap_mode='r')
+        try:
+            # The modification time orders files for pruning
+            os.utime(path)
+        except OSError:
+            pass
+    else:
+        pixels = _decoder.submit(preprocess, data).result(timeout=_config['timeout'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        stored = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=pixels.shape)
+        stored[:] = pixels
+        stored.flush()
+        del stored
+        os.replace(tmp_path, path)
+        tensor = np.load(path, mmap_mode='r')
+        _stored(os.path.getsize(path))
+
+    with _recent_lock:
+        _recent[digest] = tensor
+        while len(_recent) > RECENT_TENSORS:
+            _recent.popitem(last=False)
+    return digest, tensor
+
+def _stored(size):
+    """Account for a new file in the tensor store and prune it in the background if needed."""
+    with _store_lock:
+        _store['bytes'] += size
+        _store['writes'] += 1
+        due = _store['bytes'] > _config['cache_max_bytes'] or _store['writes'] % RESCAN_EVERY == 0
+        if not due or _store['pruning']:
+            return
+        _store['pruning'] = True
+    _decoder.submit(_prune)
+
+def _prune():
+    """Measure the tensor store and remove the least recently used files above the cap."""
+    try:
+        files = []
+        for root, _, names in os.walk(_config['directory']):
+            for name in names:
+                if not name.endswith('.npy'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Removed by another worker process
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        if total > _config['cache_max_bytes']:
+            target = _config['cache_max_bytes'] * PRUNE_TO
+            files.sort()
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            logging.info(f"Pruned {removed} cached X-ray tensors, store is now {total / (1024 * 1024):.1f} MB")
+        with _store_lock:
+            _store['bytes'] = total
+            _store['pruned'] += removed
+    except Exception as e:
+        logging.error(f"Error pruning X-ray tensor store: {str(e)}")
+    finally:
+        with _store_lock:
+            _store['pruning'] = False
+
+def predict(data):
+    """
+    Score an uploaded chest X-ray.
+
+    Args:
+        data (bytes): Encoded image
+
+    Returns:
+        tuple: (result dict, sha256 hex digest of the upload)
+    """
+    if not available():
+        raise XrayError("Chest X-ray analysis is not available on this server")
+    if not data:
+        raise XrayError("The uploaded file is empty")
+    if len(data) > _config['max_bytes']:
+        raise XrayError(f"X-ray images must be smaller than {_config['max_bytes'] // (1024 * 1024)} MB")
+
+    digest, tensor = load_tensor(data)
+    probability = _batcher.submit(tensor).result(timeout=_config['timeout'])
+    return ml_models.pneumonia_xray_result(probability), digest
+
+def stats():
+    if _batcher is None:
+        return {'available': False}
+    with _store_lock:
+        store = {'bytes': _store['bytes'], 'pruned': _store['pruned']}
+    return dict(_batcher.stats(), available=True, cached_tensors=len(_recent),
+                store_mb=round(store['bytes'] / (1024 * 1024), 2), store_pruned=store['pruned'])
+
+
+class _Batcher:
+    """Collect single images from many threads and score them in batches."""
+
+    def __init__(self, score, max_batch, max_wait):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='xray-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, tensor):
+        future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'images': self.images,
+            'avg_batch_size': round(self.images / self.batches, 2) if self.batches else 0.0
+        }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                probabilities = self.score(np.stack([tensor for tensor, _ in batch]))
+                for (_, future), probability in zip(batch, probabilities):
+                    future.set_result(float(probability))
+            except Exception as e:
+                logging.error(f"Error scoring chest X-ray batch: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+            self.images += len(batch)